@@ -0,0 +1,158 @@
+"""
+Persistent cache of iTunes cover lookups: normalized (artist, title) -> artwork URL.
+
+Two tiers:
+  - in-memory LRU (hot tier) for repeat searches within the process
+  - SQLite table `artwork_cache` (see database.Artwork), survives restarts
+
+Negative entries (iTunes has no cover) are kept too, with a shorter TTL.
+Failed lookups (network errors, rate limits) are never stored.
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.dialects.sqlite import insert
+
+try:
+    from backend.database import Artwork, SessionLocal
+    from backend.normalize import normalize_query
+except ImportError:
+    from database import Artwork, SessionLocal
+    from normalize import normalize_query
+
+POSITIVE_TTL = int(os.getenv("ARTWORK_TTL", str(30 * 24 * 3600)))  # 30 days
+NEGATIVE_TTL = int(os.getenv("ARTWORK_NEGATIVE_TTL", str(24 * 3600)))  # 1 day
+HOT_SIZE = int(os.getenv("ARTWORK_HOT_SIZE", "5000"))
+
+# key -> (expires_at, image_url or None)
+_hot: "OrderedDict[str, Tuple[float, Optional[str]]]" = OrderedDict()
+
+_stats = {
+    "hot_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "stored": 0,
+    "negative_stored": 0
+}
+
+
+def artwork_key(artist: str, title: str) -> str:
+    """Cache key for a track: normalized artist and title, so case/punctuation variants share it"""
+    return f"{normalize_query(artist)}|{normalize_query(title)}"
+
+
+def _hot_get(key: str, now: float):
+    entry = _hot.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= now:
+        del _hot[key]
+        return None
+    _hot.move_to_end(key)
+    return entry
+
+
+def _hot_put(key: str, expires_at: float, image_url: Optional[str]):
+    _hot[key] = (expires_at, image_url)
+    _hot.move_to_end(key)
+    while len(_hot) > HOT_SIZE:
+        _hot.popitem(last=False)
+
+
+def _db_lookup(keys: list) -> Dict[str, Tuple[datetime, Optional[str]]]:
+    db = SessionLocal()
+    try:
+        rows = db.query(Artwork).filter(
+            Artwork.key.in_(keys),
+            Artwork.expires_at > datetime.utcnow()
+        ).all()
+        return {row.key: (row.expires_at, row.image_url) for row in rows}
+    finally:
+        db.close()
+
+
+def _db_store(entries: Dict[str, Tuple[datetime, Optional[str]]]):
+    now = datetime.utcnow()
+    rows = [
+        {"key": key, "image_url": image_url, "fetched_at": now, "expires_at": expires_at}
+        for key, (expires_at, image_url) in entries.items()
+    ]
+    stmt = insert(Artwork).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Artwork.key],
+        set_={
+            "image_url": stmt.excluded.image_url,
+            "fetched_at": stmt.excluded.fetched_at,
+            "expires_at": stmt.excluded.expires_at
+        }
+    )
+    db = SessionLocal()
+    try:
+        db.execute(stmt)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def lookup_artwork(keys: Iterable[str]) -> Dict[str, Optional[str]]:
+    """
+    Returns the known artwork for the given keys: key -> URL, or key -> None for a
+    negative entry. Keys missing from the result have to be looked up in iTunes.
+    """
+    now = time.time()
+    found: Dict[str, Optional[str]] = {}
+    cold = []
+    for key in dict.fromkeys(keys):
+        entry = _hot_get(key, now)
+        if entry is not None:
+            found[key] = entry[1]
+            _stats["hot_hits"] += 1
+        else:
+            cold.append(key)
+
+    if cold:
+        try:
+            rows = await asyncio.to_thread(_db_lookup, cold)
+        except Exception as e:
+            print(f"⚠️ Artwork cache lookup failed: {e}")
+            rows = {}
+        for key, (expires_at, image_url) in rows.items():
+            found[key] = image_url
+            _hot_put(key, now + (expires_at - datetime.utcnow()).total_seconds(), image_url)
+        _stats["db_hits"] += len(rows)
+        _stats["misses"] += len(cold) - len(rows)
+
+    return found
+
+
+async def store_artwork(entries: Dict[str, Optional[str]]):
+    """Saves iTunes results (None = no cover) to both tiers"""
+    if not entries:
+        return
+    now = time.time()
+    utcnow = datetime.utcnow()
+    db_entries = {}
+    for key, image_url in entries.items():
+        ttl = POSITIVE_TTL if image_url else NEGATIVE_TTL
+        _hot_put(key, now + ttl, image_url)
+        db_entries[key] = (utcnow + timedelta(seconds=ttl), image_url)
+        _stats["stored" if image_url else "negative_stored"] += 1
+    try:
+        await asyncio.to_thread(_db_store, db_entries)
+    except Exception as e:
+        print(f"⚠️ Artwork cache store failed: {e}")
+
+
+def get_artwork_stats() -> Dict:
+    lookups = _stats["hot_hits"] + _stats["db_hits"] + _stats["misses"]
+    hits = _stats["hot_hits"] + _stats["db_hits"]
+    return {
+        **_stats,
+        "hot_entries": len(_hot),
+        "hit_ratio": round(hits / lookups, 3) if lookups else 0.0
+    }
@@ -0,0 +1,531 @@
+"""
+Range-aware on-disk cache for /api/stream.
+
+Every upstream audio URL gets a sparse data file plus a JSON index of the byte
+ranges (segments) that are already on disk. A request is served as a plan of
+pieces: ranges present locally are read from the file, gaps are fetched from
+upstream with a Range request and written through to the file while they are
+streamed to the listener. Once a file is complete it is served by
+CachedFileResponse without an async chunk iterator, with ETag/Last-Modified
+validators and conditional requests (If-None-Match, If-Modified-Since, If-Range).
+
+Eviction is LRU over whole files by the total number of cached bytes
+(AUDIO_CACHE_MAX_BYTES); files that are being read or written are kept.
+AUDIO_CACHE_MAX_BYTES=0 disables the cache.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "./audio_cache")
+MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GiB
+CHUNK_SIZE = 64 * 1024
+# Slices sent per ASGI message when a complete file is served from mmap
+MMAP_CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def resolve_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Turns a Range header into [start, end) for a file of `size` bytes.
+    No header means the whole file. Returns None for ranges this cache doesn't
+    serve: multiple ranges, malformed or unsatisfiable ones.
+    """
+    if not range_header:
+        return (0, size)
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return None
+        return (max(0, size - length), size)
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        return None
+    return (start, end)
+
+
+def is_unsatisfiable(range_header: Optional[str], size: int) -> bool:
+    """True for a valid single range outside the file (answered with 416); other unusable ranges are ignored"""
+    match = _RANGE_RE.match((range_header or "").strip())
+    if not match:
+        return False
+    first, last = match.group(1), match.group(2)
+    if not first:
+        return bool(last) and int(last) == 0
+    return int(first) >= size and (not last or int(last) >= int(first))
+
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """'bytes 100-199/1000' -> (100, 200, 1000); the total is None when unknown ('*')"""
+    match = _CONTENT_RANGE_RE.match((value or "").strip())
+    if not match:
+        return None
+    total = match.group(3)
+    return (int(match.group(1)), int(match.group(2)) + 1, None if total == "*" else int(total))
+
+
+class AudioEntry:
+    """One cached URL: its sparse data file and the segments present in it"""
+
+    def __init__(self, key: str, url: str, size: int, content_type: Optional[str] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 segments: Optional[List[List[int]]] = None):
+        self.key = key
+        self.url = url
+        self.size = size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.segments: List[List[int]] = segments or []  # sorted, non-overlapping [start, end)
+        self.active = 0  # readers/writers currently using the file
+
+    @property
+    def cached_bytes(self) -> int:
+        return sum(end - start for start, end in self.segments)
+
+    @property
+    def complete(self) -> bool:
+        return self.segments == [[0, self.size]]
+
+    def add_segment(self, start: int, end: int) -> int:
+        """Marks [start, end) as present, returns how many bytes are new"""
+        if end <= start:
+            return 0
+        before = self.cached_bytes
+        merged = []
+        for seg_start, seg_end in self.segments:
+            if seg_end < start or seg_start > end:
+                merged.append([seg_start, seg_end])
+            else:
+                start, end = min(start, seg_start), max(end, seg_end)
+        merged.append([start, end])
+        merged.sort()
+        self.segments = merged
+        return self.cached_bytes - before
+
+    def plan(self, start: int, end: int) -> List[Tuple[bool, int, int]]:
+        """Splits [start, end) into pieces: (True, s, e) is on disk, (False, s, e) has to be fetched"""
+        pieces = []
+        position = start
+        for seg_start, seg_end in self.segments:
+            if seg_end <= position:
+                continue
+            if seg_start >= end:
+                break
+            if seg_start > position:
+                pieces.append((False, position, seg_start))
+            piece_end = min(seg_end, end)
+            pieces.append((True, max(seg_start, position), piece_end))
+            position = piece_end
+        if position < end:
+            pieces.append((False, position, end))
+        return pieces
+
+    @property
+    def validator(self) -> str:
+        """Strong ETag of the cached file: changes whenever upstream size or validators change"""
+        source = f"{self.url}|{self.size}|{self.etag}|{self.last_modified}"
+        return '"' + hashlib.blake2b(source.encode("utf-8"), digest_size=10).hexdigest() + '"'
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "size": self.size,
+            "content_type": self.content_type,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "segments": self.segments
+        }
+
+
+class CachedFileResponse(Response):
+    """
+    Sends [start, end) of a complete cached file. Uses the ASGI zerocopysend
+    extension (sendfile) when the server offers it, otherwise mmap slices of
+    MMAP_CHUNK_SIZE, so the body never goes through a Python chunk iterator.
+    """
+
+    def __init__(self, file, start: int, end: int, status_code: int, headers: Dict[str, str],
+                 media_type: Optional[str] = None, on_close: Optional[Callable[[int], None]] = None):
+        self.file = file
+        self.start = start
+        self.end = end
+        self.on_close = on_close
+        super().__init__(status_code=status_code, headers={**headers, "Content-Length": str(end - start)},
+                         media_type=media_type)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        sent = 0
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self.file,
+                    "offset": self.start,
+                    "count": self.end - self.start
+                })
+                sent = self.end - self.start
+            else:
+                with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for position in range(self.start, self.end, MMAP_CHUNK_SIZE):
+                        chunk = mapped[position:min(position + MMAP_CHUNK_SIZE, self.end)]
+                        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                        sent += len(chunk)
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            self.file.close()
+            if self.on_close is not None:
+                self.on_close(sent)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/ prefixes are ignored"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, last_modified: str) -> bool:
+    """If-Modified-Since: True when the file hasn't changed after the given date; bad dates are ignored"""
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+
+
+class AudioCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, AudioEntry]" = OrderedDict()  # LRU order
+        self._total_bytes = 0
+        self._stats = {
+            "hit_bytes": 0, "miss_bytes": 0, "evictions": 0, "invalidations": 0,
+            "file_responses": 0, "not_modified": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and self.max_bytes > 0
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.data")
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    # --- Index ---
+
+    def load_index(self) -> int:
+        """Loads segment indexes left by a previous run, returns the number of entries"""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return 0
+        indexes = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            try:
+                with open(self._index_path(key), encoding="utf-8") as f:
+                    data = json.load(f)
+                if not os.path.exists(self._data_path(key)):
+                    raise FileNotFoundError(self._data_path(key))
+                indexes.append((os.path.getmtime(self._index_path(key)), key, data))
+            except Exception as e:
+                print(f"⚠️ Dropping broken audio cache entry {key}: {e}")
+                self._remove_files(key)
+
+        # Oldest first, so the LRU order roughly survives the restart
+        for _, key, data in sorted(indexes):
+            entry = AudioEntry(key, data["url"], data["size"], data.get("content_type"),
+                               data.get("etag"), data.get("last_modified"), data.get("segments"))
+            self._entries[key] = entry
+            self._total_bytes += entry.cached_bytes
+        self._evict()
+        return len(self._entries)
+
+    def _is_current(self, entry: AudioEntry) -> bool:
+        # An invalidated entry may still be streamed, but is no longer indexed
+        return self._entries.get(entry.key) is entry
+
+    def save_entry(self, entry: AudioEntry):
+        if not self._is_current(entry):
+            return
+        path = self._index_path(entry.key)
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(entry.to_dict(), f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"⚠️ Failed to save audio cache index for {entry.url}: {e}")
+
+    # --- Entries ---
+
+    def lookup(self, url: str) -> Optional[AudioEntry]:
+        if not self.enabled:
+            return None
+        key = self.make_key(url)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def entry_for_response(self, url: str, response: httpx.Response) -> Optional[Tuple[AudioEntry, int]]:
+        """
+        Entry to write an upstream response to and the offset its body starts at,
+        or None if the response can't be cached (unknown size, encoded body, error).
+        A cached entry whose size or ETag no longer matches upstream is reset.
+        """
+        if not self.enabled or response.headers.get("content-encoding"):
+            return None
+        if response.status_code == 206:
+            content_range = parse_content_range(response.headers.get("content-range"))
+            if content_range is None or content_range[2] is None:
+                return None
+            start, _, size = content_range
+        elif response.status_code == 200 and response.headers.get("content-length", "").isdigit():
+            start, size = 0, int(response.headers["content-length"])
+        else:
+            return None
+        if size <= 0 or size > self.max_bytes:
+            return None
+
+        etag = response.headers.get("etag")
+        entry = self.lookup(url)
+        if entry is not None and (entry.size != size or (etag and entry.etag and etag != entry.etag)):
+            self.invalidate(entry)
+            entry = None
+        if entry is None:
+            key = self.make_key(url)
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                # Start from an empty (sparse) file
+                with open(self._data_path(key), "wb"):
+                    pass
+            except OSError as e:
+                print(f"⚠️ Audio cache unavailable, streaming {url} uncached: {e}")
+                return None
+            entry = AudioEntry(key, url, size, response.headers.get("content-type"),
+                               etag, response.headers.get("last-modified"))
+            self._entries[key] = entry
+        return entry, start
+
+    def invalidate(self, entry: AudioEntry):
+        """Upstream file changed: forget the entry; streams that already opened its file finish from it"""
+        self._stats["invalidations"] += 1
+        self._drop(entry)
+
+    def _drop(self, entry: AudioEntry):
+        if self._is_current(entry):
+            del self._entries[entry.key]
+            self._total_bytes -= entry.cached_bytes
+        self._remove_files(entry.key)
+
+    def _remove_files(self, key: str):
+        for path in (self._data_path(key), self._index_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Failed to remove {path}: {e}")
+
+    def _record(self, entry: AudioEntry, start: int, end: int):
+        if self._is_current(entry):
+            self._total_bytes += entry.add_segment(start, end)
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits MAX_BYTES"""
+        for entry in list(self._entries.values()):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if entry.active:
+                continue
+            self._drop(entry)
+            self._stats["evictions"] += 1
+
+    # --- Streaming ---
+
+    async def write_through(self, entry: AudioEntry, start: int, chunks: AsyncIterator[bytes],
+                            limit: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Passes upstream chunks through while writing them to the entry's file at `start`.
+        Segments are recorded as data arrives, so an aborted download still leaves a usable prefix.
+        A disk error stops the caching, not the stream.
+        """
+        entry.active += 1
+        fd = None
+        position = start
+        try:
+            try:
+                fd = os.open(self._data_path(entry.key), os.O_RDWR | os.O_CREAT)
+            except OSError as e:
+                print(f"⚠️ Audio cache write failed for {entry.url}: {e}")
+            async for chunk in chunks:
+                if limit is not None:
+                    chunk = chunk[:max(0, start + limit - position)]
+                    if not chunk:
+                        break
+                if fd is not None:
+                    try:
+                        os.pwrite(fd, chunk, position)
+                        self._record(entry, position, position + len(chunk))
+                    except OSError as e:
+                        print(f"⚠️ Audio cache write failed for {entry.url}: {e}")
+                        os.close(fd)
+                        fd = None
+                position += len(chunk)
+                self._stats["miss_bytes"] += len(chunk)
+                yield chunk
+        finally:
+            if fd is not None:
+                os.close(fd)
+            entry.active -= 1
+            self.save_entry(entry)
+            self._evict()
+
+    async def read(self, entry: AudioEntry, start: int, end: int) -> AsyncIterator[bytes]:
+        """Yields [start, end) from the entry's file"""
+        entry.active += 1
+        fd = os.open(self._data_path(entry.key), os.O_RDONLY)
+        try:
+            position = start
+            while position < end:
+                chunk = os.pread(fd, min(CHUNK_SIZE, end - position), position)
+                if not chunk:
+                    raise IOError(f"Audio cache file is shorter than its index: {entry.url}")
+                position += len(chunk)
+                self._stats["hit_bytes"] += len(chunk)
+                yield chunk
+        finally:
+            os.close(fd)
+            entry.active -= 1
+
+    async def serve(self, entry: AudioEntry, start: int, end: int,
+                    fetch_range: Callable[[int, int], Awaitable[httpx.Response]]) -> AsyncIterator[bytes]:
+        """
+        Yields [start, end): local segments from disk, gaps via fetch_range(gap_start, gap_end)
+        (an upstream Range request), written through to disk.
+        """
+        entry.active += 1
+        try:
+            for on_disk, piece_start, piece_end in entry.plan(start, end):
+                if on_disk:
+                    async for chunk in self.read(entry, piece_start, piece_end):
+                        yield chunk
+                    continue
+
+                response = await fetch_range(piece_start, piece_end)
+                try:
+                    target = self.entry_for_response(entry.url, response)
+                    if target is None or target[0] is not entry or target[1] != piece_start:
+                        raise IOError(f"Upstream answered range {piece_start}-{piece_end - 1} "
+                                      f"with {response.status_code} {response.headers.get('content-range')}")
+                    async for chunk in self.write_through(entry, piece_start, response.aiter_bytes(),
+                                                          limit=piece_end - piece_start):
+                        yield chunk
+                finally:
+                    await response.aclose()
+        finally:
+            entry.active -= 1
+            self.save_entry(entry)
+
+    def file_response(self, entry: AudioEntry, request_headers: Mapping[str, str]) -> Optional[Response]:
+        """
+        Response for a complete entry: 304 when If-None-Match matches (or, without it,
+        when If-Modified-Since is not older than Last-Modified), 416 for a range
+        outside the file, 206 for a single range (unless If-Range is stale), 200 otherwise.
+        Returns None if the data file is gone, so the caller can fall back to upstream.
+        """
+        try:
+            file = open(self._data_path(entry.key), "rb")
+        except OSError as e:
+            print(f"⚠️ Audio cache file for {entry.url} is unavailable: {e}")
+            self.invalidate(entry)
+            return None
+
+        last_modified = entry.last_modified or formatdate(os.fstat(file.fileno()).st_mtime, usegmt=True)
+        headers = {"Accept-Ranges": "bytes", "ETag": entry.validator, "Last-Modified": last_modified}
+
+        # If-Modified-Since is only used by clients without an ETag (RFC 9110, 13.2.2)
+        if_none_match = request_headers.get("if-none-match")
+        if_modified_since = request_headers.get("if-modified-since")
+        if (_etag_matches(if_none_match, entry.validator) if if_none_match
+                else bool(if_modified_since) and _not_modified_since(if_modified_since, last_modified)):
+            file.close()
+            self._stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if range_header and if_range and if_range.strip() not in (entry.validator, last_modified):
+            # The client's copy is outdated: send the whole file instead of a part of it
+            range_header = None
+
+        if range_header and is_unsatisfiable(range_header, entry.size):
+            file.close()
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{entry.size}"})
+
+        byte_range = resolve_range(range_header, entry.size)
+        if byte_range is None or not range_header:
+            # No range, or one this cache doesn't serve (multiple/malformed ranges): whole file
+            start, end, status_code = 0, entry.size, 200
+        else:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{entry.size}"
+
+        entry.active += 1
+
+        def on_close(sent: int):
+            entry.active -= 1
+            self._stats["hit_bytes"] += sent
+
+        self._stats["file_responses"] += 1
+        return CachedFileResponse(file, start, end, status_code, headers,
+                                  media_type=entry.content_type, on_close=on_close)
+
+    def get_stats(self) -> Dict:
+        served = self._stats["hit_bytes"] + self._stats["miss_bytes"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "complete_entries": sum(1 for entry in self._entries.values() if entry.complete),
+            "cached_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            **self._stats,
+            "byte_hit_ratio": round(self._stats["hit_bytes"] / served, 3) if served else 0.0
+        }
+
+
+# Shared by all /api/stream requests
+audio_cache = AudioCache(CACHE_DIR, MAX_BYTES)
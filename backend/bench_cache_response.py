@@ -0,0 +1,91 @@
+"""
+Benchmark: CPU cost of answering a cached /api/search request.
+
+Compares the old cache-hit path (rebuild Track models from dicts, let FastAPI
+validate the response_model and encode it to JSON) with the new one
+(return the pre-encoded body stored by encode_payload as a raw Response).
+
+Run: python bench_cache_response.py
+"""
+
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+try:
+    from backend.cache import encode_payload
+    from backend.main import Track, SearchResponse, _cached_response
+except ImportError:
+    from cache import encode_payload
+    from main import Track, SearchResponse, _cached_response
+
+ITERATIONS = 2000
+
+
+def make_results(count: int = 20) -> list:
+    return [
+        Track(
+            id=str(100000 + i),
+            title=f"Трек номер {i}",
+            artist="Скриптонит",
+            duration=180 + i,
+            url=f"/api/stream?url=https%3A//rus.hitmotop.com/get/music/2024/track_{i}.mp3",
+            image=f"https://is1-ssl.mzstatic.com/image/thumb/Music/{i}/600x600bb.jpg"
+        ).dict()
+        for i in range(count)
+    ]
+
+
+def make_request(accept_encoding: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/search",
+        "headers": [(b"accept-encoding", accept_encoding.encode())]
+    })
+
+
+def legacy_hit(cached_data: dict) -> bytes:
+    """Old path: models rebuilt from the cached dicts, then response_model validation + encoding"""
+    track_models = [Track(**t) for t in cached_data["results"]]
+    response = SearchResponse(results=track_models, count=cached_data["count"])
+    validated = SearchResponse.model_validate(response.model_dump())
+    return JSONResponse(content=jsonable_encoder(validated)).body
+
+
+def bench(name: str, func, *args) -> float:
+    # warm up
+    for _ in range(50):
+        func(*args)
+    start = time.process_time()
+    for _ in range(ITERATIONS):
+        func(*args)
+    per_request_us = (time.process_time() - start) / ITERATIONS * 1_000_000
+    print(f"{name:<32} {per_request_us:10.1f} µs CPU / request")
+    return per_request_us
+
+
+def main():
+    results = make_results()
+    cached_data = {"results": results, "count": len(results)}
+    payload = encode_payload(cached_data)
+
+    # Sanity check: both paths produce the same JSON
+    assert legacy_hit(cached_data) == payload["body"], "pre-encoded body differs from FastAPI output"
+
+    plain_request = make_request("")
+    gzip_request = make_request("gzip, deflate, br")
+
+    print(f"20 tracks, {len(payload['body'])} bytes JSON"
+          f" ({len(payload['gzip'] or b'')} bytes gzipped), {ITERATIONS} iterations\n")
+    legacy = bench("legacy (models + encoding)", legacy_hit, cached_data)
+    raw = bench("pre-encoded body", _cached_response, payload, plain_request)
+    raw_gzip = bench("pre-encoded gzip body", _cached_response, payload, gzip_request)
+
+    print(f"\nSpeedup: x{legacy / raw:.1f} (plain), x{legacy / raw_gzip:.1f} (gzip)")
+
+
+if __name__ == "__main__":
+    main()
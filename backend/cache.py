@@ -1,19 +1,106 @@
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import sys
 import time
-from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 # Configuration
 TTL = 60  # seconds
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # approximate
+SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "30"))  # seconds
 
-# Storage
-# Format: key -> (expires_at_timestamp, data)
-_cache: Dict[str, Tuple[float, Any]] = {}
+# Stale-while-revalidate: expired entries are still served (and refreshed in background)
+# for at most MAX_STALE seconds after expiry
+SWR_ENABLED = os.getenv("CACHE_SWR_ENABLED", "true").lower() in ("1", "true", "yes")
+MAX_STALE = int(os.getenv("CACHE_MAX_STALE", "300"))  # seconds
+
+# Negative caching: "no results" and "upstream failed" get their own short TTLs
+EMPTY_TTL = int(os.getenv("CACHE_EMPTY_TTL", "300"))  # seconds
+FAILURE_TTL = int(os.getenv("CACHE_FAILURE_TTL", "15"))  # seconds
+# Results whose iTunes covers missed the deadline: refetched soon, when the covers are cached
+PENDING_COVERS_TTL = int(os.getenv("CACHE_PENDING_COVERS_TTL", "30"))  # seconds
+
+# Cached responses are stored as ready JSON bytes, optionally also pre-gzipped
+GZIP_ENABLED = os.getenv("CACHE_GZIP", "true").lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = 1024
+
+# Snapshot of the most requested entries, saved on shutdown and loaded on startup
+# (empty CACHE_SNAPSHOT_PATH disables it)
+SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "./cache_snapshot.json")
+SNAPSHOT_SIZE = int(os.getenv("CACHE_SNAPSHOT_SIZE", "300"))  # entries
+
+# Per-namespace policies. The namespace is the `path` part of make_cache_key ("search", "genre", ...).
+# ttl: seconds, max_entries: cap inside the namespace,
+# priority: when the global limits are exceeded, lower priority namespaces are evicted first.
+# Every value can be overridden by env: CACHE_<NAMESPACE>_TTL / _MAX_ENTRIES / _PRIORITY
+_DEFAULT_POLICIES = {
+    # Signed Hitmo URLs in results may expire, keep it short
+    "search": {"ttl": 60, "max_entries": 1500, "priority": 1},
+    # Raw multi-page result sets behind filtered (by_artist/by_track) searches
+    "search_deep": {"ttl": 60, "max_entries": 200, "priority": 1},
+    # Genre pages change about once a day
+    "genre": {"ttl": 3 * 3600, "max_entries": 300, "priority": 2},
+    # Hardcoded list, practically never changes
+    "radio": {"ttl": 24 * 3600, "max_entries": 10, "priority": 3},
+}
+
+def _load_policies() -> Dict[str, Dict[str, int]]:
+    policies = {}
+    for namespace, defaults in _DEFAULT_POLICIES.items():
+        policies[namespace] = {
+            name: int(os.getenv(f"CACHE_{namespace.upper()}_{name.upper()}", str(value)))
+            for name, value in defaults.items()
+        }
+    return policies
+
+POLICIES = _load_policies()
+
+# Used for namespaces without an explicit policy
+DEFAULT_POLICY = {"ttl": TTL, "max_entries": MAX_ENTRIES, "priority": 0}
+
+# Storage: namespace -> entries (least recently used first)
+# Entry format: key -> (stored_at_timestamp, expires_at_timestamp, size_bytes, data)
+_cache: Dict[str, "OrderedDict[str, Tuple[float, float, int, Any]]"] = {}
+_total_entries = 0
+_total_bytes = 0
+
+# Request counters used to pick entries for the snapshot: key -> lookups
+# (bounded, least recently requested keys are forgotten first)
+_popularity: "OrderedDict[str, int]" = OrderedDict()
+POPULARITY_MAX_KEYS = 4 * MAX_ENTRIES
+
+# Raw (un-normalized) keys that already filled or hit each entry: key -> raw keys.
+# Only the first hit of a new raw spelling is a hit gained by normalization.
+_raw_keys: Dict[str, set] = {}
+
+# Upstream fetches currently in progress: key -> task shared by all waiters
+_inflight: Dict[str, "asyncio.Future"] = {}
 
 # Statistics
 _stats = {
     "hits": 0,
-    "misses": 0
+    "misses": 0,
+    "evictions": 0,  # removed by LRU to respect size limits
+    "expirations": 0,  # removed because TTL passed
+    "coalesced": 0,  # misses that joined an already running upstream fetch
+    "stale_hits": 0,  # expired entries served while a refresh runs in background
+    "refreshes": 0,  # background refreshes started for stale entries
+    "normalized_hits": 0  # hits that only happened because the query was normalized
 }
 
+# Histogram bucket upper bounds
+LOOKUP_BUCKETS_US = (5, 10, 25, 50, 100, 250, 1000)  # cache lookup time, microseconds
+FILL_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)  # upstream fill time, milliseconds
+AGE_BUCKETS_S = (10, 60, 300, 900, 3600, 6 * 3600, 24 * 3600)  # entry age, seconds
+
+# Per-namespace statistics: the same counters as _stats plus latency histograms
+_ns_stats: Dict[str, Dict[str, Any]] = {}
+
 def make_cache_key(path: str, params: Dict[str, Any]) -> str:
     """
     Generates a unique cache key based on the endpoint path and parameters.
@@ -23,60 +110,491 @@ def make_cache_key(path: str, params: Dict[str, Any]) -> str:
     param_str = "&".join(f"{k}={v}" for k, v in sorted_params)
     return f"{path}|{param_str}"
 
+def encode_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Serializes a response body once, at fill time.
+    Returns {"body": json bytes, "gzip": gzipped bytes or None, "count": ...},
+    so a cache hit can be sent as is, without model validation or JSON encoding.
+    The encoding matches FastAPI's JSONResponse (utf-8, compact separators).
+    """
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressed = None
+    if GZIP_ENABLED and len(body) >= GZIP_MIN_BYTES:
+        compressed = gzip.compress(body, compresslevel=6)
+    return {
+        "body": body,
+        "gzip": compressed,
+        "count": data.get("count")
+    }
+
+def get_namespace(key: str) -> str:
+    """Returns the namespace (endpoint path) of a key built by make_cache_key"""
+    return key.split("|", 1)[0]
+
+def parse_cache_key(key: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Reverse of make_cache_key: returns (path, params) with values as strings.
+    Only exact for values without '&' and '=' (true for normalized queries and ids).
+    """
+    path, _, param_str = key.partition("|")
+    params = {}
+    if param_str:
+        for pair in param_str.split("&"):
+            name, _, value = pair.partition("=")
+            params[name] = value
+    return path, params
+
+def get_policy(namespace: str) -> Dict[str, int]:
+    return POLICIES.get(namespace, DEFAULT_POLICY)
+
+def _namespace_stats(namespace: str) -> Dict[str, Any]:
+    stats = _ns_stats.get(namespace)
+    if stats is None:
+        stats = {name: 0 for name in _stats}
+        stats["lookup_us"] = [0] * (len(LOOKUP_BUCKETS_US) + 1)
+        stats["fill_ms"] = [0] * (len(FILL_BUCKETS_MS) + 1)
+        _ns_stats[namespace] = stats
+    return stats
+
+def _count(namespace: str, name: str, amount: int = 1) -> None:
+    """Increments a counter both globally and for the namespace"""
+    _stats[name] += amount
+    _namespace_stats(namespace)[name] += amount
+
+def _observe(namespace: str, histogram: str, bounds: Tuple[int, ...], value: float) -> None:
+    _namespace_stats(namespace)[histogram][bisect.bisect_left(bounds, value)] += 1
+
+def _format_histogram(bounds: Tuple[int, ...], counts: List[int]) -> Dict[str, int]:
+    labels = [f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"]
+    return dict(zip(labels, counts))
+
+def _estimate_size(obj: Any) -> int:
+    """
+    Roughly estimates memory used by a cached value (containers are walked recursively).
+    """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += _estimate_size(k) + _estimate_size(v)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += _estimate_size(item)
+    return size
+
+def _remove(namespace: str, key: str, replaced: bool = False) -> None:
+    global _total_entries, _total_bytes
+    _, _, size, _ = _cache[namespace].pop(key)
+    if not replaced:
+        _raw_keys.pop(key, None)
+    _total_entries -= 1
+    _total_bytes -= size
+
+def _stale_deadline(expires_at: float) -> float:
+    """Moment after which an expired entry can't be served even as stale"""
+    return expires_at + MAX_STALE if SWR_ENABLED else expires_at
+
+def _evict_lru(namespace: str) -> None:
+    oldest_key = next(iter(_cache[namespace]))
+    _remove(namespace, oldest_key)
+    _count(namespace, "evictions")
+
+def _evict_overflow(namespace: str) -> None:
+    """
+    Drops least recently used entries until all limits are respected:
+    first the namespace's own max_entries, then the global limits,
+    taking victims from the lowest priority non-empty namespace.
+    """
+    entries = _cache[namespace]
+    while len(entries) > get_policy(namespace)["max_entries"]:
+        _evict_lru(namespace)
+
+    while _total_entries > MAX_ENTRIES or _total_bytes > MAX_BYTES:
+        candidates = [ns for ns, ns_entries in _cache.items() if ns_entries]
+        if not candidates:
+            break
+        victim = min(candidates, key=lambda ns: get_policy(ns)["priority"])
+        _evict_lru(victim)
+
 def get_from_cache(key: str) -> Optional[Any]:
     """
     Retrieves data from cache if it exists and hasn't expired.
-    Updates hit/miss statistics.
+    Updates hit/miss statistics and LRU order.
     """
+    data, is_stale = lookup_cache(key, allow_stale=False)
+    return data
+
+def lookup_cache(
+    key: str,
+    allow_stale: bool = True,
+    raw_key: Optional[str] = None
+) -> Tuple[Optional[Any], bool]:
+    """
+    Stale-while-revalidate lookup.
+    Returns (data, is_stale): fresh entries come back with is_stale=False,
+    expired entries inside the MAX_STALE window come back with is_stale=True
+    (the caller should trigger refresh_in_background), anything else is (None, False).
+    `raw_key` is the key built from the un-normalized query; the first hit of a raw key
+    that differs from `key` and never filled or hit the entry is counted as a normalized hit.
+    """
+    started = time.perf_counter()
+    namespace = get_namespace(key)
+    result = _lookup(namespace, key, allow_stale, raw_key)
+    _observe(namespace, "lookup_us", LOOKUP_BUCKETS_US, (time.perf_counter() - started) * 1_000_000)
+    return result
+
+def _lookup(
+    namespace: str,
+    key: str,
+    allow_stale: bool,
+    raw_key: Optional[str]
+) -> Tuple[Optional[Any], bool]:
     current_time = time.time()
-    
-    if key in _cache:
-        expires_at, data = _cache[key]
+    entries = _cache.get(namespace)
+    _record_request(key)
+
+    if entries and key in entries:
+        _, expires_at, _, data = entries[key]
         if current_time < expires_at:
-            _stats["hits"] += 1
-            return data
+            entries.move_to_end(key)
+            _count(namespace, "hits")
+            _record_raw_key(namespace, key, raw_key, hit=True)
+            return data, False
+        if current_time < _stale_deadline(expires_at):
+            # Expired, but still kept for stale-while-revalidate
+            if allow_stale:
+                entries.move_to_end(key)
+                _count(namespace, "stale_hits")
+                _record_raw_key(namespace, key, raw_key, hit=True)
+                return data, True
         else:
-            # Expired
-            del _cache[key]
-            _stats["misses"] += 1
+            # Too old even for stale serving
+            _remove(namespace, key)
+            _count(namespace, "expirations")
+
+    _count(namespace, "misses")
+    # This raw key is going to fill the entry
+    _record_raw_key(namespace, key, raw_key, hit=False)
+    return None, False
+
+def _record_raw_key(namespace: str, key: str, raw_key: Optional[str], hit: bool) -> None:
+    """Counts a normalized hit only for a raw key that never filled or hit the entry before"""
+    if raw_key is None:
+        return
+    seen = _raw_keys.setdefault(key, set())
+    if hit and raw_key != key and raw_key not in seen:
+        _count(namespace, "normalized_hits")
+    seen.add(raw_key)
+
+def _record_request(key: str) -> None:
+    _popularity[key] = _popularity.get(key, 0) + 1
+    _popularity.move_to_end(key)
+    if len(_popularity) > POPULARITY_MAX_KEYS:
+        _popularity.popitem(last=False)
+
+def peek_cache(key: str) -> Optional[Any]:
+    """
+    Returns data that can still be served (fresh or stale) without touching
+    statistics or LRU order.
+    """
+    entries = _cache.get(get_namespace(key))
+    if not entries or key not in entries:
+        return None
+    _, expires_at, _, data = entries[key]
+    return data if time.time() < _stale_deadline(expires_at) else None
+
+def has_fresh_entry(key: str) -> bool:
+    """Checks for a non-expired entry without touching statistics or LRU order"""
+    entries = _cache.get(get_namespace(key))
+    return bool(entries) and key in entries and entries[key][1] > time.time()
+
+def set_to_cache(key: str, data: Any, ttl: Optional[int] = None) -> None:
+    """
+    Saves data to cache with the namespace TTL (or an explicit one),
+    evicting old entries if needed.
+    """
+    namespace = get_namespace(key)
+    if ttl is None:
+        ttl = get_policy(namespace)["ttl"]
+
+    now = time.time()
+    _store(namespace, key, now, now + ttl, data)
+
+def _store(namespace: str, key: str, stored_at: float, expires_at: float, data: Any) -> None:
+    global _total_entries, _total_bytes
+    entries = _cache.setdefault(namespace, OrderedDict())
+    if key in entries:
+        _remove(namespace, key, replaced=True)
+
+    size = _estimate_size(key) + _estimate_size(data)
+    entries[key] = (stored_at, expires_at, size, data)
+    _total_entries += 1
+    _total_bytes += size
+    _evict_overflow(namespace)
+
+async def coalesce(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Single-flight wrapper for cache misses.
+    The first caller for a key starts `fetch()`; concurrent callers with the same key
+    await that same task instead of hitting the upstream again.
+    A cancelled caller (e.g. client disconnected) doesn't cancel the shared fetch.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = _start_fetch(key, fetch)
+    else:
+        _count(get_namespace(key), "coalesced")
+
+    return await asyncio.shield(task)
+
+def refresh_in_background(key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+    """
+    Starts a background refresh of a stale entry, unless one is already running for the key.
+    `fetch()` is expected to store the fresh data with set_to_cache itself.
+    """
+    if key in _inflight:
+        return
+    _count(get_namespace(key), "refreshes")
+    _start_fetch(key, fetch)
+
+def _start_fetch(key: str, fetch: Callable[[], Awaitable[Any]]) -> "asyncio.Future":
+    """Runs `fetch()` as a task registered in the in-flight registry until it finishes"""
+    started = time.perf_counter()
+    task = asyncio.ensure_future(fetch())
+    _inflight[key] = task
+
+    def _done(finished: "asyncio.Future") -> None:
+        if _inflight.get(key) is finished:
+            del _inflight[key]
+        if finished.cancelled():
+            return
+        # Retrieve the exception even if every waiter went away (or nobody waited at all)
+        if finished.exception() is not None:
+            print(f"❌ Cache fetch failed for '{key}': {finished.exception()}")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _observe(get_namespace(key), "fill_ms", FILL_BUCKETS_MS, elapsed_ms)
+
+    task.add_done_callback(_done)
+    return task
+
+def purge_expired() -> int:
+    """
+    Removes every entry that can no longer be served (not even as stale).
+    Returns the number of removed entries.
+    """
+    current_time = time.time()
+    removed = 0
+    for namespace, entries in _cache.items():
+        expired_keys = [
+            k for k, (_, expires_at, _, _) in entries.items()
+            if _stale_deadline(expires_at) <= current_time
+        ]
+        for key in expired_keys:
+            _remove(namespace, key)
+        if expired_keys:
+            _count(namespace, "expirations", len(expired_keys))
+        removed += len(expired_keys)
+
+    # Raw keys recorded by misses whose fetch never stored anything
+    orphaned = [k for k in _raw_keys if k not in _inflight and k not in _cache.get(get_namespace(k), {})]
+    for key in orphaned:
+        del _raw_keys[key]
+    return removed
+
+def _snapshot_value(data: Any) -> Optional[Dict[str, Any]]:
+    """
+    JSON form of a cached value: encoded payloads keep their decoded body (gzip is
+    rebuilt on load), track lists keep their tracks and covers_pending flag.
+    Failures aren't worth saving.
+    """
+    if isinstance(data, dict) and "body" in data:
+        if data.get("status_code", 200) != 200:
             return None
-    
-    _stats["misses"] += 1
+        meta = {name: value for name, value in data.items() if name not in ("body", "gzip")}
+        return {"kind": "payload", "body": json.loads(data["body"]), "meta": meta}
+    if isinstance(data, list) and not getattr(data, "failed", False):
+        return {"kind": "tracks", "items": list(data), "covers_pending": getattr(data, "covers_pending", False)}
     return None
 
-def set_to_cache(key: str, data: Any) -> None:
+def _restore_value(value: Dict[str, Any], make_tracks: Callable[[List[Any], bool], Any]) -> Any:
+    if value["kind"] == "payload":
+        payload = encode_payload(value["body"])
+        payload.update(value["meta"])
+        return payload
+    return make_tracks(value["items"], value["covers_pending"])
+
+def save_snapshot(path: str = SNAPSHOT_PATH, size: int = SNAPSHOT_SIZE) -> int:
     """
-    Saves data to cache with the configured TTL.
+    Saves the `size` most requested entries (with payloads and expiry times) to `path`,
+    so the next process can start warm. Returns the number of saved entries.
     """
-    expires_at = time.time() + TTL
-    _cache[key] = (expires_at, data)
+    if not path:
+        return 0
+
+    cached = [
+        (key, (stored_at, expires_at, value))
+        for entries in _cache.values()
+        for key, (stored_at, expires_at, _, data) in entries.items()
+        for value in (_snapshot_value(data),)
+        if value is not None
+    ]
+    cached.sort(key=lambda item: _popularity.get(item[0], 0), reverse=True)
+
+    snapshot = {
+        "saved_at": time.time(),
+        "entries": [
+            {
+                "key": key,
+                "stored_at": stored_at,
+                "expires_at": expires_at,
+                "value": value,
+                "requests": _popularity.get(key, 0)
+            }
+            for key, (stored_at, expires_at, value) in cached[:size]
+        ]
+    }
+
+    # Write to a temp file first so a crash can't leave a truncated snapshot;
+    # per-process name, so workers shutting down together don't write the same file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(snapshot["entries"])
+
+def load_snapshot(path: str = SNAPSHOT_PATH,
+                  make_tracks: Callable[[List[Any], bool], Any] = lambda items, covers_pending: items) -> List[str]:
+    """
+    Restores entries saved by save_snapshot that can still be served (fresh or stale).
+    `make_tracks(items, covers_pending)` rebuilds cached track lists in the caller's type
+    (the parser's TrackList), since JSON only keeps the plain list.
+    Returns all snapshot keys, most requested first, e.g. for a warm-up refetch.
+    """
+    if not path or not os.path.exists(path):
+        return []
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        print(f"❌ Failed to load cache snapshot {path}: {e}")
+        return []
+
+    current_time = time.time()
+    restored = 0
+    # Least requested first, so the most requested end up at the MRU end
+    for item in reversed(snapshot["entries"]):
+        key = item["key"]
+        _popularity[key] = item["requests"]
+        if _stale_deadline(item["expires_at"]) <= current_time:
+            continue
+        namespace = get_namespace(key)
+        _store(namespace, key, item["stored_at"], item["expires_at"], _restore_value(item["value"], make_tracks))
+        restored += 1
+
+    print(f"♻️ Cache snapshot loaded: {restored}/{len(snapshot['entries'])} entries restored")
+    return [item["key"] for item in snapshot["entries"]]
+
+async def cache_sweeper_task() -> None:
+    """
+    Background task that periodically purges expired entries,
+    so keys that are never requested again don't stay in memory.
+    """
+    print("🔄 Cache sweeper task started")
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            removed = purge_expired()
+            if removed:
+                print(f"🧹 Cache sweep: removed {removed} expired entries")
+        except Exception as e:
+            print(f"❌ Error in cache sweeper task: {e}")
+
+def _describe_namespace(namespace: str, current_time: float) -> Dict[str, Any]:
+    """Counters, memory estimate, entry ages and latency histograms of one namespace"""
+    entries = _cache.get(namespace, {})
+    stats = _namespace_stats(namespace)
+
+    ages = [0] * (len(AGE_BUCKETS_S) + 1)
+    size_bytes = 0
+    stale_entries = 0
+    for stored_at, expires_at, size, _ in entries.values():
+        ages[bisect.bisect_left(AGE_BUCKETS_S, current_time - stored_at)] += 1
+        size_bytes += size
+        if expires_at <= current_time:
+            stale_entries += 1
+
+    lookups = stats["hits"] + stats["misses"] + stats["stale_hits"]
+    return {
+        **get_policy(namespace),
+        "entries": len(entries),
+        "stale_entries": stale_entries,
+        "approx_bytes": size_bytes,
+        **{name: stats[name] for name in _stats},
+        "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0,
+        "age_seconds": _format_histogram(AGE_BUCKETS_S, ages),
+        "lookup_latency_us": _format_histogram(LOOKUP_BUCKETS_US, stats["lookup_us"]),
+        "fill_latency_ms": _format_histogram(FILL_BUCKETS_MS, stats["fill_ms"])
+    }
 
 def get_cache_stats() -> Dict[str, Any]:
     """
-    Returns current cache statistics.
+    Returns current cache statistics, overall and per namespace.
     """
-    total_entries = len(_cache)
     hits = _stats["hits"]
     misses = _stats["misses"]
     total_requests = hits + misses
     hit_ratio = (hits / total_requests) if total_requests > 0 else 0
-    
+    # Share of lookups served only thanks to query normalization
+    lookups = total_requests + _stats["stale_hits"]
+    normalization_gain = (_stats["normalized_hits"] / lookups) if lookups > 0 else 0
+
     # Get first 5 keys for debugging
-    sample_keys = list(_cache.keys())[:5]
-    
+    sample_keys = [key for entries in _cache.values() for key in entries][:5]
+
+    current_time = time.time()
+    namespaces = {
+        namespace: _describe_namespace(namespace, current_time)
+        for namespace in sorted(set(POLICIES) | set(_cache) | set(_ns_stats))
+    }
+
     return {
-        "total_entries": total_entries,
+        "total_entries": _total_entries,
         "cache_hits": hits,
         "cache_misses": misses,
         "hit_ratio": round(hit_ratio, 4),
         "ttl_seconds": TTL,
-        "sample_keys": sample_keys
+        "sample_keys": sample_keys,
+        "max_entries": MAX_ENTRIES,
+        "max_bytes": MAX_BYTES,
+        "approx_bytes": _total_bytes,
+        "evictions": _stats["evictions"],
+        "expirations": _stats["expirations"],
+        "coalesced": _stats["coalesced"],
+        "inflight": len(_inflight),
+        "swr_enabled": SWR_ENABLED,
+        "max_stale_seconds": MAX_STALE,
+        "stale_hits": _stats["stale_hits"],
+        "refreshes": _stats["refreshes"],
+        "normalized_hits": _stats["normalized_hits"],
+        "normalization_gain": round(normalization_gain, 4),
+        "namespaces": namespaces
     }
 
 def reset_cache() -> None:
     """
     Clears the cache and resets statistics.
     """
+    global _total_entries, _total_bytes
     _cache.clear()
-    _stats["hits"] = 0
-    _stats["misses"] = 0
+    _popularity.clear()
+    _raw_keys.clear()
+    _total_entries = 0
+    _total_bytes = 0
+    for name in _stats:
+        _stats[name] = 0
+    _ns_stats.clear()
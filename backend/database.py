@@ -81,6 +81,14 @@ class Referral(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)  # When referral made first purchase
 
+class Artwork(Base):
+    __tablename__ = "artwork_cache"
+
+    key = Column(String, primary_key=True)  # normalized "artist|title"
+    image_url = Column(String, nullable=True)  # NULL = iTunes has no cover (negative entry)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
 
 
 def init_db():
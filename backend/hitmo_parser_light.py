@@ -1,15 +1,46 @@
 import httpx
-from bs4 import BeautifulSoup
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 import urllib.parse
 import asyncio
 import os
-import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from backend.proxy_pool import proxy_pool, NoHealthyProxyError
+    from backend.artwork_cache import artwork_key, get_artwork_stats, lookup_artwork, store_artwork
+    from backend.track_extractor import DEFAULT_BACKEND, ItemSplitter, extract_tracks
+except ImportError:
+    from proxy_pool import proxy_pool, NoHealthyProxyError
+    from artwork_cache import artwork_key, get_artwork_stats, lookup_artwork, store_artwork
+    from track_extractor import DEFAULT_BACKEND, ItemSplitter, extract_tracks
+
+
+class TrackList(list):
+    """
+    List of parsed tracks that also tells "no results" apart from "upstream failed".
+    Behaves like a plain list, so callers that only need the tracks keep working.
+    """
+
+    def __init__(self, tracks=(), error: Optional[str] = None, retry_after: float = 0,
+                 reached_upstream: bool = True, covers_pending: bool = False):
+        super().__init__(tracks)
+        self.error = error  # None on success
+        self.retry_after = retry_after  # seconds until the upstream may be retried
+        # False when the request was refused locally (retry-after window), not by Hitmo
+        self.reached_upstream = reached_upstream
+        # Some iTunes covers missed the deadline: fallback images now, better ones in the artwork cache soon
+        self.covers_pending = covers_pending
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
 
 class HitmoParser:
     """
-    Lightweight parser for Hitmo using httpx and BeautifulSoup.
+    Lightweight parser for Hitmo using httpx and a pluggable HTML extractor (see track_extractor).
     Suitable for Vercel/Serverless environments.
     Supports proxy rotation and custom user agents.
     """
@@ -17,10 +48,33 @@ class HitmoParser:
     BASE_URL = "https://rus.hitmotop.com"
     SEARCH_URL = f"{BASE_URL}/search"
     
+    # Long-lived connection pools (one client per proxy), reused across requests
+    MAX_CONNECTIONS = int(os.getenv("HITMO_MAX_CONNECTIONS", "100"))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HITMO_MAX_KEEPALIVE", "20"))
+    KEEPALIVE_EXPIRY = float(os.getenv("HITMO_KEEPALIVE_EXPIRY", "30"))  # seconds
+    HTTP2 = os.getenv("HITMO_HTTP2", "false").lower() in ("1", "true", "yes")
+    
+    # Backoff after upstream failures (transport errors, 5xx, 429), per proxy:
+    # 2s, 4s, 8s ... up to 60s, reset on first success
+    BACKOFF_BASE = float(os.getenv("HITMO_BACKOFF_BASE", "2"))
+    BACKOFF_MAX = float(os.getenv("HITMO_BACKOFF_MAX", "60"))
+    
+    # HTML parsing is CPU-bound and runs off the event loop: thread | process | none (inline)
+    PARSE_POOL = os.getenv("HITMO_PARSE_POOL", "thread").lower()
+    PARSE_WORKERS = int(os.getenv("HITMO_PARSE_WORKERS", "2"))
+    # Parse the page while it downloads and drop the connection once `limit` tracks are found
+    STREAM_PARSE = os.getenv("HITMO_STREAM_PARSE", "false").lower() in ("1", "true", "yes")
+    
+    # Covers not back from iTunes within the deadline fall back to Hitmo's own (0 = wait for all)
+    COVER_DEADLINE = float(os.getenv("HITMO_COVER_DEADLINE", "0.4"))  # seconds
+    ITUNES_CONCURRENCY = int(os.getenv("HITMO_ITUNES_CONCURRENCY", "10"))
+    # Max distinct iTunes lookups in flight or queued behind ITUNES_CONCURRENCY
+    ITUNES_MAX_PENDING = int(os.getenv("HITMO_ITUNES_MAX_PENDING", "200"))
+    
     def __init__(self):
-        # Load proxy list from environment
-        proxy_list_str = os.getenv("PROXY_LIST", "")
-        self.proxy_list = [p.strip() for p in proxy_list_str.split(",") if p.strip()]
+        # Proxies from PROXY_LIST, chosen by health (shared with /api/stream)
+        self.proxy_pool = proxy_pool
+        self.proxy_list = proxy_pool.proxies
         
         # Default headers (fallback)
         self.default_headers = {
@@ -29,12 +83,172 @@ class HitmoParser:
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
         }
+        
+        # Pooled clients: proxy (None = direct) -> client
+        self._clients: Dict[Optional[str], httpx.AsyncClient] = {}
+        self.http2 = self.HTTP2
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("WARNING: HITMO_HTTP2 is enabled but 'h2' is not installed (pip install httpx[http2]), using HTTP/1.1")
+                self.http2 = False
+        
+        # Retry-after windows per proxy (None = direct): proxy -> (consecutive failures, window end)
+        self._backoff: Dict[Optional[str], Tuple[int, float]] = {}
+        
+        # Parse worker pool (created on first use) and its queue metrics
+        self._parse_executor: Optional[Executor] = None
+        self._parse_queue_depth = 0
+        self._parse_stats = {
+            "parsed": 0, "max_queue_depth": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "downloaded_bytes": 0, "early_closes": 0, "late_covers": 0,
+            "shared_cover_lookups": 0, "rejected_cover_lookups": 0
+        }
+        
+        # Outstanding iTunes calls per process, and lookups in flight: artwork_key -> task
+        # (shared by every request waiting for that cover, finishes even after the deadline)
+        self._itunes_semaphore = asyncio.Semaphore(max(1, self.ITUNES_CONCURRENCY))
+        self._cover_lookups: Dict[str, asyncio.Task] = {}
     
-    def _get_random_proxy(self) -> Optional[str]:
-        """Get random proxy from the list"""
-        if not self.proxy_list:
-            return None
-        return random.choice(self.proxy_list)
+    def _get_random_proxy(self, allow_probe: bool = True, exclude: Set[str] = frozenset()) -> Optional[str]:
+        """Get a proxy from the pool, weighted by health (None = direct connection)"""
+        return self.proxy_pool.choose(allow_probe=allow_probe, exclude=exclude)
+    
+    async def _send(self, proxy: Optional[str], send):
+        """Awaits `send()` and reports the outcome to the proxy pool"""
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.TransportError:
+            self.proxy_pool.record_error(proxy)
+            raise
+        self.proxy_pool.record_result(proxy, response.status_code, time.perf_counter() - start)
+        return response
+    
+    def _get_client(self, proxy: Optional[str]) -> httpx.AsyncClient:
+        """
+        Returns the long-lived client for a proxy (created on first use), so
+        DNS/TCP/TLS to Hitmo and iTunes are paid once per pooled connection, not per request.
+        """
+        client = self._clients.get(proxy)
+        if client is None:
+            client = httpx.AsyncClient(
+                headers=self.default_headers,
+                timeout=10.0,
+                proxy=proxy,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.MAX_CONNECTIONS,
+                    max_keepalive_connections=self.MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=self.KEEPALIVE_EXPIRY
+                )
+            )
+            self._clients[proxy] = client
+        return client
+    
+    def _get_parse_executor(self) -> Optional[Executor]:
+        """Returns the parse pool (None = parse inline on the event loop)"""
+        if self._parse_executor is None and self.PARSE_POOL != "none":
+            workers = max(1, self.PARSE_WORKERS)
+            if self.PARSE_POOL == "process":
+                self._parse_executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                self._parse_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hitmo-parse")
+        return self._parse_executor
+    
+    async def _extract_tracks(self, html: str, limit: int) -> List[Dict]:
+        """
+        Pipeline step 2: runs extract_tracks in the parse pool, so a large page doesn't stall
+        other requests (and /api/stream chunks) while it is being parsed.
+        """
+        executor = self._get_parse_executor()
+        start = time.perf_counter()
+        self._parse_queue_depth += 1
+        self._parse_stats["max_queue_depth"] = max(self._parse_stats["max_queue_depth"], self._parse_queue_depth)
+        try:
+            if executor is None:
+                return extract_tracks(html, limit)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, extract_tracks, html, limit)
+        finally:
+            self._parse_queue_depth -= 1
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._parse_stats["parsed"] += 1
+            self._parse_stats["total_ms"] += elapsed_ms
+            self._parse_stats["max_ms"] = max(self._parse_stats["max_ms"], elapsed_ms)
+    
+    def get_parse_stats(self) -> Dict:
+        """
+        Parse pool metrics: queue depth is the number of pages waiting for or being parsed,
+        parse times include the time spent waiting in the queue
+        """
+        parsed = self._parse_stats["parsed"]
+        return {
+            "pool": self.PARSE_POOL,
+            "workers": max(1, self.PARSE_WORKERS) if self.PARSE_POOL != "none" else 0,
+            "backend": DEFAULT_BACKEND,
+            "queue_depth": self._parse_queue_depth,
+            "max_queue_depth": self._parse_stats["max_queue_depth"],
+            "parsed": parsed,
+            "avg_parse_ms": round(self._parse_stats["total_ms"] / parsed, 2) if parsed else 0.0,
+            "max_parse_ms": round(self._parse_stats["max_ms"], 2),
+            "stream_parse": self.STREAM_PARSE,
+            "downloaded_bytes": self._parse_stats["downloaded_bytes"],
+            "early_closes": self._parse_stats["early_closes"],
+            "late_covers": self._parse_stats["late_covers"],
+            "shared_cover_lookups": self._parse_stats["shared_cover_lookups"],
+            "rejected_cover_lookups": self._parse_stats["rejected_cover_lookups"],
+            "pending_cover_lookups": len(self._cover_lookups),
+            "artwork": get_artwork_stats()
+        }
+    
+    def _backoff_remaining(self, proxy: Optional[str]) -> float:
+        return self._backoff.get(proxy, (0, 0.0))[1] - time.time()
+    
+    def _choose_proxy(self) -> Tuple[Optional[str], Optional[TrackList]]:
+        """
+        Picks a proxy outside its retry-after window. Returns (proxy, None), or
+        (None, failed result) when every route to Hitmo is backing off or unhealthy.
+        """
+        backed_off = {proxy for proxy in self._backoff if proxy is not None and self._backoff_remaining(proxy) > 0}
+        try:
+            proxy = self._get_random_proxy(exclude=backed_off)
+        except NoHealthyProxyError as e:
+            windows = [self._backoff_remaining(proxy) for proxy in backed_off]
+            return None, TrackList(error=str(e), retry_after=min(windows + [e.retry_after]), reached_upstream=False)
+        remaining = self._backoff_remaining(proxy)
+        if remaining > 0:
+            return None, TrackList(error="backoff", retry_after=remaining, reached_upstream=False)
+        return proxy, None
+    
+    @staticmethod
+    def _is_upstream_failure(error: Exception) -> bool:
+        """Errors that say the route to Hitmo is unhealthy (as opposed to e.g. a 404 for a bad genre id)"""
+        if isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+            return status_code >= 500 or status_code == 429
+        return isinstance(error, httpx.TransportError)
+    
+    def _record_success(self, proxy: Optional[str], tracks: List[Dict], covers_pending: bool = False) -> TrackList:
+        self._backoff.pop(proxy, None)
+        return TrackList(tracks, covers_pending=covers_pending)
+    
+    def _record_failure(self, proxy: Optional[str], error: Exception) -> TrackList:
+        """
+        Upstream health failures start (or extend) the proxy's retry-after window, so an
+        outage doesn't turn into a retry storm. Other 4xx mean "nothing here": an empty result.
+        """
+        if self._is_upstream_failure(error):
+            failures = self._backoff.get(proxy, (0, 0.0))[0] + 1
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (failures - 1))
+            self._backoff[proxy] = (failures, time.time() + delay)
+            return TrackList(error=str(error) or type(error).__name__, retry_after=delay)
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code != 403:
+            # e.g. 404 for an unknown genre id: nothing there, not an outage
+            return self._record_success(proxy, [])
+        # Blocked (the proxy pool takes the proxy out of rotation) or a local error: no window
+        return TrackList(error=str(error) or type(error).__name__)
     
     def _prepare_headers(self, user_agent: Optional[str] = None) -> dict:
         """Prepare headers with custom user agent if provided"""
@@ -43,7 +257,180 @@ class HitmoParser:
             headers['User-Agent'] = user_agent
         return headers
         
-    async def search(self, query: str, limit: int = 20, page: int = 1, user_agent: Optional[str] = None) -> List[Dict]:
+    async def _fetch_page(self, url: str, params: Dict, proxy: Optional[str], user_agent: Optional[str] = None,
+                          **request_kwargs):
+        """Pipeline step 1: downloads a Hitmo page, returns the client (reused for covers) and the HTML"""
+        headers = self._prepare_headers(user_agent)
+        
+        client = self._get_client(proxy)
+        response = await self._send(
+            proxy, lambda: client.get(url, params=params, headers=headers, **request_kwargs)
+        )
+        response.raise_for_status()
+        self._parse_stats["downloaded_bytes"] += response.num_bytes_downloaded
+        return client, response.text
+    
+    async def _stream_tracks(self, url: str, params: Dict, limit: int, proxy: Optional[str],
+                             user_agent: Optional[str] = None, **request_kwargs):
+        """
+        Pipeline steps 1-2 in streaming mode: items are parsed as soon as they are complete
+        in the downloaded text, and the connection is closed once `limit` tracks are found,
+        so the rest of the page is never transferred (through a paid proxy).
+        """
+        headers = self._prepare_headers(user_agent)
+        
+        client = self._get_client(proxy)
+        splitter = ItemSplitter()
+        tracks: List[Dict] = []
+        request = client.build_request("GET", url, params=params, headers=headers)
+        response = await self._send(proxy, lambda: client.send(request, stream=True, **request_kwargs))
+        try:
+            response.raise_for_status()
+            async for text in response.aiter_text():
+                fragment = splitter.feed(text)
+                if fragment:
+                    tracks += await self._extract_tracks(fragment, limit - len(tracks))
+                    if len(tracks) >= limit:
+                        self._parse_stats["early_closes"] += 1
+                        break
+            else:
+                fragment = splitter.close()
+                if fragment:
+                    tracks += await self._extract_tracks(fragment, limit - len(tracks))
+            self._parse_stats["downloaded_bytes"] += response.num_bytes_downloaded
+        finally:
+            await response.aclose()
+        return client, tracks
+    
+    async def _fetch_tracks(self, url: str, params: Dict, limit: int, proxy: Optional[str],
+                            user_agent: Optional[str] = None, **request_kwargs):
+        """Pipeline steps 1-2: returns the client (reused for covers) and up to `limit` extracted tracks"""
+        if self.STREAM_PARSE:
+            return await self._stream_tracks(url, params, limit, proxy, user_agent, **request_kwargs)
+        client, html = await self._fetch_page(url, params, proxy, user_agent, **request_kwargs)
+        return client, await self._extract_tracks(html, limit)
+    
+    async def _enrich_covers(self, client: httpx.AsyncClient, tracks: List[Dict],
+                             fetch_missing: bool = True) -> Tuple[List[Optional[str]], bool]:
+        """
+        Pipeline step 3: finds covers for all tracks (None = use the fallback image).
+        With fetch_missing=False only the artwork cache is used, iTunes is left to /api/covers.
+        Also returns whether some iTunes lookups are still pending (missed the deadline or failed).
+        """
+        keys = [artwork_key(track['artist'], track['title']) for track in tracks]
+        covers = await self._lookup_covers(client, dict(zip(keys, tracks)), fetch_missing)
+        pending = fetch_missing and any(key not in covers for key in keys)
+        return [covers.get(key) for key in keys], pending
+    
+    async def _lookup_covers(self, client: Optional[httpx.AsyncClient], tracks: Dict[str, Dict],
+                             fetch_missing: bool = True) -> Dict[str, Optional[str]]:
+        """
+        Covers for tracks keyed by artwork_key. Known ones come from the artwork cache,
+        the rest is fetched from iTunes in parallel. A lookup already in flight for a key is
+        joined instead of started again; past ITUNES_MAX_PENDING lookups new keys are skipped.
+        Lookups still running at COVER_DEADLINE are missing from the result, they finish in
+        background and cache their covers for the next request.
+        """
+        covers = await lookup_artwork(tracks)
+        
+        missing = {key: track for key, track in tracks.items() if key not in covers}
+        if missing and fetch_missing:
+            tasks = {}
+            for key, track in missing.items():
+                task = self._cover_lookups.get(key)
+                if task is not None:
+                    self._parse_stats["shared_cover_lookups"] += 1
+                elif len(self._cover_lookups) >= self.ITUNES_MAX_PENDING:
+                    self._parse_stats["rejected_cover_lookups"] += 1
+                    continue
+                else:
+                    task = self._start_cover_lookup(client, key, track)
+                tasks[key] = task
+            
+            if tasks:
+                done, pending = await asyncio.wait(tasks.values(), timeout=self.COVER_DEADLINE or None)
+                covers.update(self._collect_covers({key: task for key, task in tasks.items() if task in done}))
+                self._parse_stats["late_covers"] += len(pending)
+        
+        return covers
+    
+    def _start_cover_lookup(self, client: httpx.AsyncClient, key: str, track: Dict) -> asyncio.Task:
+        task = asyncio.create_task(self._fetch_cover(client, key, track['artist'], track['title']))
+        self._cover_lookups[key] = task
+        
+        def forget(finished: asyncio.Task):
+            self._cover_lookups.pop(key, None)
+            # Nobody may be waiting anymore: retrieve the exception so it isn't logged as unhandled
+            if not finished.cancelled():
+                finished.exception()
+        
+        task.add_done_callback(forget)
+        return task
+    
+    async def resolve_covers(self, tracks: List[Dict]) -> Dict[str, Optional[str]]:
+        """
+        Batch cover lookup for tracks with 'artist' and 'title' (used by /api/covers).
+        Returns artwork_key -> URL (None = iTunes has no cover) for the covers resolved
+        within COVER_DEADLINE; the rest is still being fetched and can be asked for again.
+        """
+        keyed = {artwork_key(track['artist'], track['title']): track for track in tracks}
+        try:
+            # iTunes outcomes are not reported to the pool, so don't spend a half-open probe on them
+            client = self._get_client(self._get_random_proxy(allow_probe=False))
+        except NoHealthyProxyError:
+            # No route to iTunes right now: only what the artwork cache already has
+            return await self._lookup_covers(None, keyed, fetch_missing=False)
+        return await self._lookup_covers(client, keyed)
+    
+    @staticmethod
+    def _collect_covers(tasks: Dict[str, asyncio.Task]) -> Dict[str, Optional[str]]:
+        """Results of finished lookups; failed ones are left out (uncached), so they are retried next time"""
+        return {
+            key: task.result() for key, task in tasks.items()
+            if not task.cancelled() and task.exception() is None
+        }
+    
+    async def _fetch_cover(self, client: httpx.AsyncClient, key: str, artist: str, title: str) -> Optional[str]:
+        """One iTunes lookup bounded by ITUNES_CONCURRENCY outstanding calls per process, cached once found"""
+        async with self._itunes_semaphore:
+            cover = await self._get_itunes_cover(client, artist, title)
+        await store_artwork({key: cover})
+        return cover
+    
+    @staticmethod
+    def _finalize_track(track: Dict, cover: Optional[str]) -> Dict:
+        """Pipeline step 4: picks the best available image (iTunes -> Hitmo cover -> generated avatar)"""
+        fallback_image = track.pop('fallback_image')
+        track['image'] = (
+            cover
+            or fallback_image
+            or f"https://ui-avatars.com/api/?name={urllib.parse.quote(track['artist'])}&size=200&background=random"
+        )
+        return track
+    
+    async def _run_pipeline(self, url: str, params: Dict, limit: int, user_agent: Optional[str],
+                            error_label: str, defer_covers: bool = False, **request_kwargs) -> TrackList:
+        """
+        fetch -> extract -> enrich -> finalize, shared by search and genre pages.
+        Extraction stops after `limit` tracks (see track_extractor.iter_tracks), so
+        small limits parse and enrich proportionally less.
+        """
+        proxy, backoff = self._choose_proxy()
+        if backoff is not None:
+            return backoff
+        
+        try:
+            client, tracks = await self._fetch_tracks(url, params, limit, proxy, user_agent, **request_kwargs)
+            covers, covers_pending = await self._enrich_covers(client, tracks, fetch_missing=not defer_covers)
+            return self._record_success(proxy, [
+                self._finalize_track(track, cover) for track, cover in zip(tracks, covers)
+            ], covers_pending=covers_pending)
+        except Exception as e:
+            print(f"{error_label}: {e}")
+            return self._record_failure(proxy, e)
+        
+    async def search(self, query: str, limit: int = 20, page: int = 1, user_agent: Optional[str] = None,
+                     defer_covers: bool = False) -> TrackList:
         """
         Search for tracks (Async)
         
@@ -52,248 +439,59 @@ class HitmoParser:
             limit: Number of results
             page: Page number
             user_agent: Custom user agent from real user (optional)
+            defer_covers: Don't wait for iTunes, only use already cached artwork
+        
+        Returns:
+            TrackList: empty with `failed == False` means "no results",
+            `failed == True` means the upstream request failed (see `retry_after`)
         """
-        try:
-            params = {
-                'q': query,
-                'start': (page - 1) * limit # Use limit for offset calculation
-            }
-            
-            # Prepare headers with custom user agent
-            headers = self._prepare_headers(user_agent)
-            
-            # Get random proxy if available
-            proxy = self._get_random_proxy()
-            proxies = {"http://": proxy, "https://": proxy} if proxy else None
-            
-            async with httpx.AsyncClient(
-                headers=headers, 
-                timeout=10.0,
-                proxies=proxies
-            ) as client:
-                response = await client.get(self.SEARCH_URL, params=params)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                tracks_data = []
-                
-                track_elements = soup.select('.tracks__item')
-                
-                # 1. Parse basic info
-                for el in track_elements:
-                    if len(tracks_data) >= limit:
-                        break
-                        
-                    try:
-                        title_el = el.select_one('.track__title')
-                        artist_el = el.select_one('.track__desc')
-                        time_el = el.select_one('.track__fulltime')
-                        download_el = el.select_one('a.track__download-btn')
-                        cover_el = el.select_one('.track__img')
-                        
-                        if not (title_el and download_el):
-                            continue
-                            
-                        title = title_el.text.strip()
-                        artist = artist_el.text.strip() if artist_el else "Unknown"
-                        duration_str = time_el.text.strip() if time_el else "00:00"
-                        
-                        try:
-                            mins, secs = map(int, duration_str.split(':'))
-                            duration = mins * 60 + secs
-                        except:
-                            duration = 0
-                            
-                        url = download_el.get('href')
-                        if not url:
-                            continue
-                            
-                        track_id = el.get('data-track-id')
-                        if not track_id:
-                            track_id = f"gen_{abs(hash(artist + title))}"
-                            
-                        # Extract fallback cover from style
-                        fallback_image = None
-                        if cover_el:
-                            style = cover_el.get('style', '')
-                            match = re.search(r"url\(['\"]?(.*?)['\"]?\)", style)
-                            if match:
-                                fallback_image = match.group(1)
-                        
-                        tracks_data.append({
-                            'id': track_id,
-                            'title': title,
-                            'artist': artist,
-                            'duration': duration,
-                            'url': url,
-                            'fallback_image': fallback_image,
-                            'image': None # Will be filled later
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error parsing track: {e}")
-                        continue
-                
-                # 2. Fetch iTunes covers in parallel
-                tasks = []
-                for track in tracks_data:
-                    tasks.append(self._get_itunes_cover(client, track['artist'], track['title']))
-                
-                covers = await asyncio.gather(*tasks)
-                
-                # 3. Merge covers
-                final_tracks = []
-                for track, cover in zip(tracks_data, covers):
-                    image = cover
-                    if not image:
-                        image = track['fallback_image']
-                    if not image:
-                        image = f"https://ui-avatars.com/api/?name={urllib.parse.quote(track['artist'])}&size=200&background=random"
-                    
-                    track['image'] = image
-                    del track['fallback_image'] # Clean up
-                    final_tracks.append(track)
-                    
-                return final_tracks
-                
-        except Exception as e:
-            print(f"Search error: {e}")
-            return []
+        params = {
+            'q': query,
+            'start': (page - 1) * limit # Use limit for offset calculation
+        }
+        return await self._run_pipeline(self.SEARCH_URL, params, limit, user_agent, "Search error",
+                                        defer_covers=defer_covers)
 
     async def _get_itunes_cover(self, client: httpx.AsyncClient, artist: str, title: str) -> Optional[str]:
         """
         Get high quality cover from iTunes API (Async)
+        
+        Returns None if iTunes has no cover, raises if the lookup itself failed
+        (so that the failure is not cached as "no cover").
         """
-        try:
-            term = f"{artist} {title}"
-            params = {
-                'term': term,
-                'media': 'music',
-                'entity': 'song',
-                'limit': 1
-            }
-            
-            # Use the existing client session
-            response = await client.get("https://itunes.apple.com/search", params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['resultCount'] > 0:
-                    artwork = data['results'][0].get('artworkUrl100')
-                    if artwork:
-                        return re.sub(r'\d+x\d+bb', '600x600bb', artwork)
-            return None
-        except:
-            return None
+        term = f"{artist} {title}"
+        params = {
+            'term': term,
+            'media': 'music',
+            'entity': 'song',
+            'limit': 1
+        }
+        
+        # Use the existing client session
+        response = await client.get("https://itunes.apple.com/search", params=params)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data['resultCount'] > 0:
+            artwork = data['results'][0].get('artworkUrl100')
+            if artwork:
+                return re.sub(r'\d+x\d+bb', '600x600bb', artwork)
+        return None
     
-    async def get_genre_tracks(self, genre_id: int, limit: int = 20, page: int = 1, user_agent: Optional[str] = None) -> List[Dict]:
+    async def get_genre_tracks(self, genre_id: int, limit: int = 20, page: int = 1, user_agent: Optional[str] = None,
+                               defer_covers: bool = False) -> TrackList:
         """
         Get tracks from a specific genre (Async)
+        
+        Returns:
+            TrackList, see `search` for the meaning of empty and failed results
         """
-        try:
-            url = f"{self.BASE_URL}/genre/{genre_id}"
-            params = {
-                'start': (page - 1) * limit
-            }
-            
-            # Prepare headers with custom user agent
-            headers = self._prepare_headers(user_agent)
-            
-            # Get random proxy if available
-            proxy = self._get_random_proxy()
-            proxies = {"http://": proxy, "https://": proxy} if proxy else None
-            
-            async with httpx.AsyncClient(
-                headers=headers, 
-                timeout=10.0, 
-                follow_redirects=True,
-                proxies=proxies
-            ) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                tracks_data = []
-                
-                track_elements = soup.select('.tracks__item')
-                
-                for el in track_elements:
-                    if len(tracks_data) >= limit:
-                        break
-                        
-                    try:
-                        title_el = el.select_one('.track__title')
-                        artist_el = el.select_one('.track__desc')
-                        time_el = el.select_one('.track__fulltime')
-                        download_el = el.select_one('a.track__download-btn')
-                        cover_el = el.select_one('.track__img')
-                        
-                        if not (title_el and download_el):
-                            continue
-                            
-                        title = title_el.text.strip()
-                        artist = artist_el.text.strip() if artist_el else "Unknown"
-                        duration_str = time_el.text.strip() if time_el else "00:00"
-                        
-                        try:
-                            mins, secs = map(int, duration_str.split(':'))
-                            duration = mins * 60 + secs
-                        except:
-                            duration = 0
-                            
-                        url = download_el.get('href')
-                        if not url:
-                            continue
-                            
-                        track_id = el.get('data-track-id')
-                        if not track_id:
-                            track_id = f"gen_{abs(hash(artist + title))}"
-                            
-                        fallback_image = None
-                        if cover_el:
-                            style = cover_el.get('style', '')
-                            match = re.search(r"url\(['\"]?(.*?)['\"]?\)", style)
-                            if match:
-                                fallback_image = match.group(1)
-                        
-                        tracks_data.append({
-                            'id': track_id,
-                            'title': title,
-                            'artist': artist,
-                            'duration': duration,
-                            'url': url,
-                            'fallback_image': fallback_image,
-                            'image': None
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error parsing track: {e}")
-                        continue
-                
-                # Fetch covers in parallel
-                tasks = []
-                for track in tracks_data:
-                    tasks.append(self._get_itunes_cover(client, track['artist'], track['title']))
-                
-                covers = await asyncio.gather(*tasks)
-                
-                final_tracks = []
-                for track, cover in zip(tracks_data, covers):
-                    image = cover
-                    if not image:
-                        image = track['fallback_image']
-                    if not image:
-                        image = f"https://ui-avatars.com/api/?name={urllib.parse.quote(track['artist'])}&size=200&background=random"
-                    
-                    track['image'] = image
-                    del track['fallback_image']
-                    final_tracks.append(track)
-                    
-                return final_tracks
-                
-        except Exception as e:
-            print(f"Genre tracks error: {e}")
-            return []
+        url = f"{self.BASE_URL}/genre/{genre_id}"
+        params = {
+            'start': (page - 1) * limit
+        }
+        return await self._run_pipeline(url, params, limit, user_agent, "Genre tracks error",
+                                        defer_covers=defer_covers, follow_redirects=True)
 
     def get_radio_stations(self) -> List[Dict]:
         """
@@ -502,5 +700,16 @@ class HitmoParser:
         
         return stations
 
-    def close(self):
-        pass
+    async def close(self):
+        """Closes all pooled HTTP clients and the parse pool"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+        
+        for task in list(self._cover_lookups.values()):
+            task.cancel()
+        
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(wait=True, cancel_futures=True)
+            self._parse_executor = None
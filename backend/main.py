@@ -3,34 +3,53 @@ FastAPI Backend for Telegram Music Mini App
 """
 
 from fastapi import FastAPI, HTTPException, Query, Depends, Body, BackgroundTasks, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 import uvicorn
 from sqlalchemy.orm import Session
 from datetime import datetime
+import json
+import os
+from dotenv import load_dotenv
+
+# До импорта модулей проекта: их настройки читаются из окружения при импорте (PROXY_LIST, CACHE_*, HITMO_*)
+load_dotenv()
 
 try:
-    from backend.hitmo_parser_light import HitmoParser
+    from backend.hitmo_parser_light import HitmoParser, TrackList
+    from backend.proxy_pool import proxy_pool, NoHealthyProxyError
+    from backend.stream_pool import get_stream_client, make_trace, get_stream_stats, close_stream_clients
+    from backend.audio_cache import audio_cache, resolve_range
+    from backend.artwork_cache import artwork_key
     from backend.database import User, DownloadedMessage, Lyrics, Payment, Referral, get_db, init_db, SessionLocal
-    from backend.cache import make_cache_key, get_from_cache, set_to_cache, get_cache_stats, reset_cache
+    from backend.cache import (
+        make_cache_key, set_to_cache, get_cache_stats, reset_cache, cache_sweeper_task,
+        coalesce, lookup_cache, refresh_in_background, encode_payload, parse_cache_key, has_fresh_entry,
+        peek_cache, save_snapshot, load_snapshot, EMPTY_TTL, FAILURE_TTL, PENDING_COVERS_TTL
+    )
     from backend.lyrics_service import LyricsService
+    from backend.normalize import normalize_query
     from backend.payments import create_stars_invoice, verify_ton_transaction, grant_premium_after_payment
     from backend.tribute import verify_tribute_signature
 except ImportError:
-    from hitmo_parser_light import HitmoParser
+    from hitmo_parser_light import HitmoParser, TrackList
+    from proxy_pool import proxy_pool, NoHealthyProxyError
+    from stream_pool import get_stream_client, make_trace, get_stream_stats, close_stream_clients
+    from audio_cache import audio_cache, resolve_range
+    from artwork_cache import artwork_key
     from database import User, DownloadedMessage, Lyrics, Payment, Referral, get_db, init_db, SessionLocal
-    from cache import make_cache_key, get_from_cache, set_to_cache, get_cache_stats, reset_cache
+    from cache import (
+        make_cache_key, set_to_cache, get_cache_stats, reset_cache, cache_sweeper_task,
+        coalesce, lookup_cache, refresh_in_background, encode_payload, parse_cache_key, has_fresh_entry,
+        peek_cache, save_snapshot, load_snapshot, EMPTY_TTL, FAILURE_TTL, PENDING_COVERS_TTL
+    )
     from lyrics_service import LyricsService
+    from normalize import normalize_query
     from payments import create_stars_invoice, verify_ton_transaction, grant_premium_after_payment
     from tribute import verify_tribute_signature
 
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
 
 # Pydantic модели
 class Track(BaseModel):
@@ -45,6 +64,18 @@ class SearchResponse(BaseModel):
     results: List[Track]
     count: int
 
+class CoverRequestItem(BaseModel):
+    id: str
+    artist: str
+    title: str
+
+class CoversRequest(BaseModel):
+    tracks: List[CoverRequestItem]
+
+class CoversResponse(BaseModel):
+    covers: Dict[str, Optional[str]]  # track id -> iTunes cover (None = нет обложки, оставить текущую)
+    pending: List[str]  # еще не найдены, можно запросить позже
+
 class RadioStation(BaseModel):
     id: str
     name: str
@@ -153,6 +184,44 @@ class CacheStats(BaseModel):
     hit_ratio: float
     ttl_seconds: int
     sample_keys: List[str]
+    max_entries: int
+    max_bytes: int
+    approx_bytes: int
+    evictions: int
+    expirations: int
+    coalesced: int
+    inflight: int
+    swr_enabled: bool
+    max_stale_seconds: int
+    stale_hits: int
+    refreshes: int
+    normalized_hits: int
+    normalization_gain: float
+    namespaces: Dict[str, Dict[str, Any]]
+
+class ParserStats(BaseModel):
+    pool: str
+    workers: int
+    backend: str
+    queue_depth: int
+    max_queue_depth: int
+    parsed: int
+    avg_parse_ms: float
+    max_parse_ms: float
+    stream_parse: bool
+    downloaded_bytes: int
+    early_closes: int
+    late_covers: int
+    shared_cover_lookups: int
+    rejected_cover_lookups: int
+    pending_cover_lookups: int
+    artwork: Dict[str, Any]
+
+class ProxyPoolStats(BaseModel):
+    proxies: List[Dict[str, Any]]
+    direct_fallback: bool
+    direct_fallbacks: int
+    rejected: int
 
 class UserListItem(BaseModel):
     id: int
@@ -711,6 +780,16 @@ async def background_deletion_task():
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    # Восстанавливаем популярные записи кэша, сохраненные при прошлой остановке
+    snapshot_keys = load_snapshot(make_tracks=_snapshot_tracks)
+    if CACHE_WARMUP_ENABLED and snapshot_keys:
+        asyncio.create_task(warm_up_cache(snapshot_keys))
+    # Фоновая очистка просроченных записей кэша
+    asyncio.create_task(cache_sweeper_task())
+    # Индекс дискового кэша аудио с прошлого запуска
+    audio_entries = audio_cache.load_index()
+    if audio_entries:
+        print(f"🎵 Audio cache: {audio_entries} files loaded from {audio_cache.directory}")
     # Фоновая задача удаления треков временно отключена
     # asyncio.create_task(background_deletion_task())
 
@@ -918,9 +997,310 @@ async def reset_admin_cache(admin_id: int = Query(...), db: Session = Depends(ge
     reset_cache()
     return {"status": "ok", "message": "Cache cleared"}
 
+@app.get("/api/admin/parser/stats", response_model=ParserStats)
+async def get_admin_parser_stats(user_id: int = Query(...), db: Session = Depends(get_db)):
+    """Статистика пула парсинга HTML Hitmo: очередь и время разбора (только для админов)"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return parser.get_parse_stats()
+
+@app.get("/api/admin/proxies/stats", response_model=ProxyPoolStats)
+async def get_admin_proxy_stats(user_id: int = Query(...), db: Session = Depends(get_db)):
+    """Здоровье прокси: успешность, задержка, доля 403/429 и состояние circuit breaker (только для админов)"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return proxy_pool.get_stats()
+
+@app.get("/api/admin/stream/stats")
+async def get_admin_stream_stats(user_id: int = Query(...), db: Session = Depends(get_db)):
+    """Переиспользование соединений /api/stream по хостам апстрима и дисковый кэш аудио (только для админов)"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_admin:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return {**get_stream_stats(), "audio_cache": audio_cache.get_stats()}
+
 
 # --- Music Endpoints ---
 
+def _cached_response(payload: Dict[str, Any], request: Request) -> Response:
+    """
+    Отдает заранее сериализованный ответ из кэша (см. encode_payload) без повторной
+    валидации моделей и JSON-кодирования. Gzip-версия отдается, если клиент ее принимает.
+    """
+    status_code = payload.get("status_code", 200)
+    headers = {"Vary": "Accept-Encoding"}
+    if "retry_after" in payload:
+        headers["Retry-After"] = str(payload["retry_after"])
+    if payload["gzip"] is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload["gzip"], status_code=status_code, media_type="application/json", headers=headers)
+    return Response(content=payload["body"], status_code=status_code, media_type="application/json", headers=headers)
+
+
+def _snapshot_tracks(items: List[Dict[str, Any]], covers_pending: bool) -> TrackList:
+    """Набор треков глубокого поиска из снимка кэша (JSON хранит только сам список)"""
+    return TrackList(items, covers_pending=covers_pending)
+
+
+def _is_negative(data: Any) -> bool:
+    """Закэшированная ошибка апстрима (payload с кодом != 200 или TrackList.failed)"""
+    if isinstance(data, dict):
+        return data.get("status_code", 200) != 200
+    return getattr(data, "failed", False)
+
+
+async def _get_or_load(cache_key: str, fetch, raw_key: Optional[str] = None) -> Any:
+    """
+    Достает данные из кэша, при промахе загружает их (один запрос на все одновременные промахи).
+    Устаревшие данные отдаются сразу и обновляются в фоне; устаревшая ошибка всегда перезапрашивается.
+    """
+    cached_data, is_stale = lookup_cache(cache_key, raw_key=raw_key)
+    if cached_data is None or (is_stale and _is_negative(cached_data)):
+        return await coalesce(cache_key, fetch)
+    if is_stale:
+        refresh_in_background(cache_key, fetch)
+    return cached_data
+
+
+def _store_track_results(cache_key: str, tracks: List[Dict[str, Any]], empty: bool,
+                         covers_pending: bool = False, **extra) -> Dict[str, Any]:
+    """
+    Кэширует результат Hitmo как готовый ответ.
+    - ошибка апстрима: 503 + Retry-After на FAILURE_TTL (а если есть устаревший нормальный ответ, отдаем его);
+      отказ без запроса в Hitmo (окно retry-after) не кэшируется - он не говорит ничего о самом ключе
+    - пустой ответ апстрима (`empty`): кэшируется на EMPTY_TTL
+    - часть обложек iTunes не успела к дедлайну (`covers_pending`): PENDING_COVERS_TTL,
+      после него запрос повторяется и берет уже закэшированные обложки
+    - иначе: TTL namespace
+    """
+    if getattr(tracks, "failed", False):
+        previous = peek_cache(cache_key)
+        if previous is not None and not _is_negative(previous):
+            return previous
+
+        retry_after = max(FAILURE_TTL, int(tracks.retry_after + 0.999))
+        payload = encode_payload({
+            "detail": "Источник временно недоступен, попробуйте позже",
+            "retry_after": retry_after
+        })
+        payload["status_code"] = 503
+        payload["retry_after"] = retry_after
+        if tracks.reached_upstream:
+            set_to_cache(cache_key, payload, ttl=retry_after)
+        return payload
+
+    cacheable_results = _wrap_stream_urls(tracks)
+    payload = encode_payload({
+        "results": cacheable_results,
+        "count": len(cacheable_results),
+        **extra
+    })
+    set_to_cache(cache_key, payload, ttl=_results_ttl(empty, covers_pending))
+    return payload
+
+
+def _results_ttl(empty: bool, covers_pending: bool) -> Optional[int]:
+    """TTL для результатов Hitmo (None = TTL namespace)"""
+    if empty:
+        return EMPTY_TTL
+    if covers_pending:
+        return PENDING_COVERS_TTL
+    return None
+
+
+def _wrap_stream_urls(tracks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Конвертирует треки в словари для кэша, оборачивая URL в прокси /api/stream"""
+    from urllib.parse import quote
+
+    base_url = ""
+    cacheable_results = []
+    for track in tracks:
+        original_url = track['url']
+        if original_url:
+            encoded_url = quote(original_url)
+            # Копия: исходные словари могут лежать в кэше (результаты глубокого поиска)
+            track = {**track, 'url': f"{base_url}/api/stream?url={encoded_url}"}
+
+        cacheable_results.append(Track(**track).dict())
+    return cacheable_results
+
+
+# Глубокий поиск: сколько страниц Hitmo (по 48 треков) скачивать и сколько из них одновременно
+DEEP_SEARCH_PAGES = int(os.getenv("DEEP_SEARCH_PAGES", "3"))
+DEEP_SEARCH_CONCURRENCY = int(os.getenv("DEEP_SEARCH_CONCURRENCY", "3"))
+
+
+async def _load_deep_search(
+    cache_key: str,
+    q: str,
+    user_agent: Optional[str],
+    defer_covers: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    Глубокий поиск: скачивает несколько страниц Hitmo и кэширует весь набор треков.
+    Фильтрация (by_artist/by_track) и пагинация делаются поверх этого набора,
+    поэтому следующие страницы и смена фильтра не требуют новых запросов.
+    """
+    print(f"DEBUG: Deep search for query='{q}'")
+    # Страницы скачиваются параллельно (не больше DEEP_SEARCH_CONCURRENCY одновременно),
+    # а склеиваются по порядку
+    semaphore = asyncio.Semaphore(DEEP_SEARCH_CONCURRENCY)
+
+    async def fetch_page(p: int) -> TrackList:
+        async with semaphore:
+            print(f"DEBUG: Fetching page {p}...")
+            return await parser.search(q, limit=48, page=p, user_agent=user_agent, defer_covers=defer_covers)
+
+    tasks = [asyncio.create_task(fetch_page(p)) for p in range(1, DEEP_SEARCH_PAGES + 1)]
+
+    def cancel_after_last_page(task: asyncio.Task):
+        # Короткая страница - последняя: страницы после нее не нужны, даже если предыдущие еще грузятся
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if not result.failed and len(result) < 20:
+            for later in tasks[tasks.index(task) + 1:]:
+                later.cancel()
+
+    for task in tasks:
+        task.add_done_callback(cancel_after_last_page)
+
+    all_tracks = TrackList()
+    try:
+        for p, task in enumerate(tasks, start=1):
+            try:
+                page_tracks = await task
+            except Exception as e:
+                print(f"DEBUG: Error fetching page {p}: {e}")
+                break
+            if page_tracks.failed:
+                if p == 1:
+                    # Первая страница не загрузилась - весь набор считается ошибкой
+                    all_tracks = page_tracks
+                break
+            all_tracks.extend(page_tracks)
+            all_tracks.covers_pending = all_tracks.covers_pending or page_tracks.covers_pending
+            if len(page_tracks) < 20: # Если вернулось мало треков, значит страницы кончились
+                break
+    finally:
+        # Следующие страницы уже не нужны (или запрос отменен) - отменяем их загрузку
+        for task in tasks:
+            task.cancel()
+
+    print(f"DEBUG: Total tracks fetched: {len(all_tracks)}")
+    if all_tracks.failed:
+        # Устаревший, но нормальный набор лучше, чем закэшированная ошибка
+        previous = peek_cache(cache_key)
+        if previous is not None and not _is_negative(previous):
+            return previous
+        if all_tracks.reached_upstream:
+            set_to_cache(cache_key, all_tracks, ttl=FAILURE_TTL)
+    else:
+        set_to_cache(cache_key, all_tracks, ttl=_results_ttl(not all_tracks, all_tracks.covers_pending))
+    return all_tracks
+
+
+async def _load_search_results(
+    cache_key: str,
+    q: str,
+    limit: int,
+    page: int,
+    by_artist: bool,
+    by_track: bool,
+    user_agent: Optional[str],
+    defer_covers: bool = False
+) -> Dict[str, Any]:
+    """
+    Загружает результаты поиска из Hitmo и сохраняет их в кэш.
+    Вызывается через coalesce, поэтому одновременные промахи по одному ключу делают один запрос.
+    `q` уже нормализован (normalize_query).
+    """
+    # Если включена фильтрация, берем общий набор глубокого поиска (один на запрос, для всех страниц и фильтров)
+    if by_artist or by_track:
+        print(f"DEBUG: Deep search enabled for query='{q}' (Artist={by_artist}, Track={by_track})")
+        deep_key = make_cache_key("search_deep", {"q": q, "defer_covers": defer_covers})
+        tracks = await _get_or_load(deep_key, lambda: _load_deep_search(deep_key, q, user_agent, defer_covers))
+    else:
+        # Обычный поиск - одна страница
+        tracks = await parser.search(q, limit=limit, page=page, user_agent=user_agent, defer_covers=defer_covers)
+        print(f"DEBUG: Search query='{q}', limit={limit}, page={page}. Found {len(tracks)} tracks before filtering.")
+
+    if getattr(tracks, "failed", False):
+        return _store_track_results(cache_key, tracks, empty=False)
+    # Пустой ответ самого Hitmo (а не результат фильтрации) кэшируем на EMPTY_TTL
+    upstream_empty = not tracks
+    covers_pending = getattr(tracks, "covers_pending", False)
+
+    # Фильтрация по артисту или треку если запрошено (сравниваем нормализованные строки)
+    if by_artist:
+        print(f"DEBUG: Filtering by artist. Query='{q}'")
+        tracks = [
+            track for track in tracks
+            if q in normalize_query(track['artist'])
+        ]
+        print(f"DEBUG: Found {len(tracks)} tracks after artist filtering.")
+    elif by_track:
+        print(f"DEBUG: Filtering by track. Query='{q}'")
+        tracks = [
+            track for track in tracks
+            if q in normalize_query(track['title'])
+        ]
+        print(f"DEBUG: Found {len(tracks)} tracks after track filtering.")
+
+    # Пагинация для отфильтрованных результатов (если был глубокий поиск)
+    if by_artist or by_track:
+        start_idx = (page - 1) * limit
+        end_idx = start_idx + limit
+        tracks = tracks[start_idx:end_idx]
+        print(f"DEBUG: Returning slice [{start_idx}:{end_idx}] (Count: {len(tracks)})")
+
+    return _store_track_results(cache_key, tracks, empty=upstream_empty, covers_pending=covers_pending)
+
+
+async def _get_search_payload(
+    q: str,
+    limit: int,
+    page: int,
+    by_artist: bool,
+    by_track: bool,
+    defer_covers: bool,
+    user_agent: Optional[str],
+    cached_only: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Результат поиска из кэша или из Hitmo (через coalesce). Общий для /api/search и /api/search/stream.
+    cached_only=True: только свежая запись из кэша, None если ее нет.
+    """
+    # Один и тот же запрос в разном регистре/с лишними пробелами -> один ключ и один запрос в Hitmo
+    normalized_q = normalize_query(q) or q.strip()
+
+    key_params = {
+        "limit": limit,
+        "page": page,
+        "by_artist": by_artist,
+        "by_track": by_track,
+        "defer_covers": defer_covers
+    }
+    cache_key = make_cache_key("search", {**key_params, "q": normalized_q})
+    raw_key = make_cache_key("search", {**key_params, "q": q})
+
+    if cached_only and not has_fresh_entry(cache_key):
+        return None
+
+    return await _get_or_load(
+        cache_key,
+        lambda: _load_search_results(
+            cache_key, normalized_q, limit, page, by_artist, by_track, user_agent, defer_covers
+        ),
+        raw_key=raw_key
+    )
+
+
 @app.get("/api/search", response_model=SearchResponse)
 async def search_tracks(
     request: Request,
@@ -928,7 +1308,8 @@ async def search_tracks(
     limit: int = Query(20, description="Максимальное количество результатов", ge=1, le=50),
     page: int = Query(1, description="Номер страницы", ge=1),
     by_artist: bool = Query(False, description="Искать только по исполнителю"),
-    by_track: bool = Query(False, description="Искать только по названию трека")
+    by_track: bool = Query(False, description="Искать только по названию трека"),
+    defer_covers: bool = Query(False, description="Не ждать обложки iTunes (догружаются через POST /api/covers)")
 ):
     """
     Поиск треков по запросу (с кэшированием)
@@ -937,106 +1318,11 @@ async def search_tracks(
         # Get user agent
         user_agent = request.headers.get('user-agent')
         
-        # 1. Проверяем кэш
-        cache_key = make_cache_key("search", {
-            "q": q, 
-            "limit": limit, 
-            "page": page, 
-            "by_artist": by_artist,
-            "by_track": by_track
-        })
-        
-        cached_data = get_from_cache(cache_key)
-        if cached_data:
-            # Возвращаем данные из кэша, но нужно преобразовать словари обратно в объекты Track
-            # так как в кэше мы храним сериализованные данные (список словарей)
-            track_models = [Track(**t) for t in cached_data["results"]]
-            return SearchResponse(
-                results=track_models,
-                count=cached_data["count"]
-            )
+        # 1-2. Кэш, при промахе - запрос (один на все одновременные промахи)
+        cached_data = await _get_search_payload(q, limit, page, by_artist, by_track, defer_covers, user_agent)
 
-        # 2. Если нет в кэше, делаем запрос
-        
-        # Если включена фильтрация, делаем глубокий поиск (скачиваем несколько страниц)
-        if by_artist or by_track:
-            print(f"DEBUG: Deep search enabled for query='{q}' (Artist={by_artist}, Track={by_track})")
-            all_tracks = []
-            # Скачиваем первые 3 страницы (Hitmo обычно отдает по 48 треков на страницу)
-            # Это ~144 трека, что должно хватить для нахождения нужного артиста
-            for p in range(1, 4):
-                try:
-                    print(f"DEBUG: Fetching page {p}...")
-                    page_tracks = await parser.search(q, limit=48, page=p, user_agent=user_agent)
-                    all_tracks.extend(page_tracks)
-                    if len(page_tracks) < 20: # Если вернулось мало треков, значит страницы кончились
-                        break
-                except Exception as e:
-                    print(f"DEBUG: Error fetching page {p}: {e}")
-                    break
-            
-            print(f"DEBUG: Total tracks fetched: {len(all_tracks)}")
-            tracks = all_tracks
-        else:
-            # Обычный поиск - одна страница
-            tracks = await parser.search(q, limit=limit, page=page, user_agent=user_agent)
-            print(f"DEBUG: Search query='{q}', limit={limit}, page={page}. Found {len(tracks)} tracks before filtering.")
-        
-        # Фильтрация по артисту или треку если запрошено
-        query_lower = q.lower()
-        
-        if by_artist:
-            print(f"DEBUG: Filtering by artist. Query='{query_lower}'")
-            tracks = [
-                track for track in tracks 
-                if query_lower in track['artist'].lower()
-            ]
-            print(f"DEBUG: Found {len(tracks)} tracks after artist filtering.")
-        elif by_track:
-            print(f"DEBUG: Filtering by track. Query='{query_lower}'")
-            tracks = [
-                track for track in tracks 
-                if query_lower in track['title'].lower()
-            ]
-            print(f"DEBUG: Found {len(tracks)} tracks after track filtering.")
-
-        # Пагинация для отфильтрованных результатов (если был глубокий поиск)
-        if by_artist or by_track:
-            start_idx = (page - 1) * limit
-            end_idx = start_idx + limit
-            tracks = tracks[start_idx:end_idx]
-            print(f"DEBUG: Returning slice [{start_idx}:{end_idx}] (Count: {len(tracks)})")
-        
-        # Конвертируем в Pydantic модели и оборачиваем URL в прокси
-        track_models = []
-        base_url = "" 
-        
-        # Подготавливаем данные для кэша (чистые словари)
-        cacheable_results = []
-        
-        for track in tracks:
-            original_url = track['url']
-            if original_url:
-                from urllib.parse import quote
-                encoded_url = quote(original_url)
-                track['url'] = f"{base_url}/api/stream?url={encoded_url}"
-            
-            track_model = Track(**track)
-            track_models.append(track_model)
-            cacheable_results.append(track_model.dict())
-        
-        response_data = {
-            "results": cacheable_results,
-            "count": len(cacheable_results)
-        }
-        
-        # 3. Сохраняем в кэш
-        set_to_cache(cache_key, response_data)
-        
-        return SearchResponse(
-            results=track_models,
-            count=len(track_models)
-        )
+        # В кэше хранится уже готовое JSON-тело ответа
+        return _cached_response(cached_data, request)
         
     except Exception as e:
         raise HTTPException(
@@ -1045,6 +1331,73 @@ async def search_tracks(
         )
 
 
+def _stream_event(fmt: str, event: str, data: Dict[str, Any]) -> bytes:
+    """Одно событие потока: строка NDJSON ({"event": ..., ...}) или server-sent event"""
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+    return (json.dumps({"event": event, **data}, ensure_ascii=False) + "\n").encode()
+
+
+@app.get("/api/search/stream")
+async def search_tracks_stream(
+    request: Request,
+    q: str = Query(..., description="Поисковый запрос", min_length=1),
+    limit: int = Query(20, description="Максимальное количество результатов", ge=1, le=50),
+    page: int = Query(1, description="Номер страницы", ge=1),
+    by_artist: bool = Query(False, description="Искать только по исполнителю"),
+    by_track: bool = Query(False, description="Искать только по названию трека"),
+    format: str = Query("ndjson", description="ndjson или sse", pattern="^(ndjson|sse)$")
+):
+    """
+    Поиск с постепенной выдачей (NDJSON или SSE, также по Accept: text/event-stream):
+    - tracks: результаты сразу после разбора страницы Hitmo, без ожидания iTunes
+    - covers: обложки iTunes по id трека (pending - не успели найтись)
+    - done / error
+    Кэш и coalesce общие с /api/search: готовый полный ответ отдается одним событием tracks,
+    иначе берется результат с defer_covers=true.
+    """
+    user_agent = request.headers.get('user-agent')
+    fmt = "sse" if format == "sse" or "text/event-stream" in request.headers.get("accept", "") else "ndjson"
+
+    async def events():
+        try:
+            # Полный ответ с обложками уже в кэше - догружать нечего
+            payload = await _get_search_payload(
+                q, limit, page, by_artist, by_track, False, user_agent, cached_only=True
+            )
+            covers_ready = payload is not None
+            if payload is None:
+                payload = await _get_search_payload(q, limit, page, by_artist, by_track, True, user_agent)
+
+            data = json.loads(payload["body"])
+            status_code = payload.get("status_code", 200)
+            if status_code != 200:
+                yield _stream_event(fmt, "error", {"status_code": status_code, **data})
+                return
+            yield _stream_event(fmt, "tracks", data)
+
+            if not covers_ready and data["results"]:
+                resolved, pending = await _resolve_track_covers(data["results"])
+                # Только новые обложки (известные уже пришли в tracks из кэша обложек)
+                current = {track["id"]: track["image"] for track in data["results"]}
+                covers = {
+                    track_id: image for track_id, image in resolved.items()
+                    if image and image != current[track_id]
+                }
+                yield _stream_event(fmt, "covers", {"covers": covers, "pending": pending})
+
+            yield _stream_event(fmt, "done", {})
+        except Exception as e:
+            print(f"Search stream error: {e}")
+            yield _stream_event(fmt, "error", {"status_code": 500, "detail": f"Ошибка при поиске: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if fmt == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/track/{track_id}", response_model=Track)
 async def get_track(track_id: str):
     """
@@ -1056,40 +1409,33 @@ async def get_track(track_id: str):
     )
 
 
+async def _load_radio_stations(cache_key: str) -> Dict[str, Any]:
+    """Загружает список радиостанций и сохраняет его в кэш"""
+    stations = parser.get_radio_stations()
+
+    # Валидируем через Pydantic модели
+    station_models = [RadioStation(**station) for station in stations]
+
+    payload = encode_payload({
+        "results": [s.dict() for s in station_models],
+        "count": len(station_models)
+    })
+    set_to_cache(cache_key, payload)
+    return payload
+
+
 @app.get("/api/radio")
-async def get_radio_stations():
+async def get_radio_stations(request: Request):
     """
     Получение списка радиостанций (с кэшированием)
     """
     try:
         # 1. Проверяем кэш
         cache_key = make_cache_key("radio", {})
-        cached_data = get_from_cache(cache_key)
-        
-        if cached_data:
-            station_models = [RadioStation(**s) for s in cached_data["results"]]
-            return {
-                "results": station_models,
-                "count": cached_data["count"]
-            }
-
-        # 2. Запрос
-        stations = parser.get_radio_stations()
+        # 2. Запрос при промахе
+        cached_data = await _get_or_load(cache_key, lambda: _load_radio_stations(cache_key))
         
-        # Конвертируем в Pydantic модели
-        station_models = [RadioStation(**station) for station in stations]
-        
-        # 3. Сохраняем в кэш
-        cacheable_data = {
-            "results": [s.dict() for s in station_models],
-            "count": len(station_models)
-        }
-        set_to_cache(cache_key, cacheable_data)
-        
-        return {
-            "results": station_models,
-            "count": len(station_models)
-        }
+        return _cached_response(cached_data, request)
         
     except Exception as e:
         raise HTTPException(
@@ -1098,12 +1444,29 @@ async def get_radio_stations():
         )
 
 
+async def _load_genre_tracks(
+    cache_key: str,
+    genre_id: int,
+    limit: int,
+    page: int,
+    user_agent: Optional[str],
+    defer_covers: bool = False
+) -> Dict[str, Any]:
+    """Загружает треки жанра из Hitmo и сохраняет их в кэш"""
+    tracks = await parser.get_genre_tracks(
+        genre_id, limit=limit, page=page, user_agent=user_agent, defer_covers=defer_covers
+    )
+    return _store_track_results(cache_key, tracks, empty=not tracks, covers_pending=tracks.covers_pending,
+                                genre_id=genre_id)
+
+
 @app.get("/api/genre/{genre_id}")
 async def get_genre_tracks(
     request: Request,
     genre_id: int,
     limit: int = Query(20, description="Максимальное количество результатов", ge=1, le=50),
-    page: int = Query(1, description="Номер страницы", ge=1)
+    page: int = Query(1, description="Номер страницы", ge=1),
+    defer_covers: bool = Query(False, description="Не ждать обложки iTunes (догружаются через POST /api/covers)")
 ):
     """
     Получение треков конкретного жанра (с кэшированием)
@@ -1113,49 +1476,18 @@ async def get_genre_tracks(
         cache_key = make_cache_key("genre", {
             "genre_id": genre_id,
             "limit": limit,
-            "page": page
+            "page": page,
+            "defer_covers": defer_covers
         })
         
-        cached_data = get_from_cache(cache_key)
-        if cached_data:
-            track_models = [Track(**t) for t in cached_data["results"]]
-            return {
-                "results": track_models,
-                "count": cached_data["count"],
-                "genre_id": genre_id
-            }
-
-        # 2. Запрос
+        # 2. Запрос (один на все одновременные промахи)
         user_agent = request.headers.get('user-agent')
-        tracks = await parser.get_genre_tracks(genre_id, limit=limit, page=page, user_agent=user_agent)
-        
-        track_models = []
-        base_url = ""
-        cacheable_results = []
-        
-        for track in tracks:
-            original_url = track['url']
-            if original_url:
-                from urllib.parse import quote
-                encoded_url = quote(original_url)
-                track['url'] = f"{base_url}/api/stream?url={encoded_url}"
-            
-            track_model = Track(**track)
-            track_models.append(track_model)
-            cacheable_results.append(track_model.dict())
-        
-        # 3. Сохраняем в кэш
-        response_data = {
-            "results": cacheable_results,
-            "count": len(cacheable_results)
-        }
-        set_to_cache(cache_key, response_data)
-        
-        return {
-            "results": track_models,
-            "count": len(track_models),
-            "genre_id": genre_id
-        }
+        cached_data = await _get_or_load(
+            cache_key,
+            lambda: _load_genre_tracks(cache_key, genre_id, limit, page, user_agent, defer_covers)
+        )
+
+        return _cached_response(cached_data, request)
         
     except Exception as e:
         raise HTTPException(
@@ -1164,13 +1496,125 @@ async def get_genre_tracks(
         )
 
 
+# Максимум треков в одном запросе /api/covers
+COVERS_BATCH_LIMIT = int(os.getenv("COVERS_BATCH_LIMIT", "100"))
+
+
+@app.post("/api/covers", response_model=CoversResponse)
+async def resolve_covers(request: CoversRequest):
+    """
+    Догрузка обложек iTunes для результатов, полученных с defer_covers=true.
+    Одинаковые исполнитель/название ищутся один раз, известные обложки берутся из кэша.
+    Что не успело найтись за HITMO_COVER_DEADLINE, возвращается в pending.
+    """
+    if len(request.tracks) > COVERS_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Too many tracks (max {COVERS_BATCH_LIMIT})")
+
+    covers, pending = await _resolve_track_covers([item.dict() for item in request.tracks])
+    return CoversResponse(covers=covers, pending=pending)
+
+
+async def _resolve_track_covers(tracks: List[Dict[str, Any]]) -> Tuple[Dict[str, Optional[str]], List[str]]:
+    """
+    Обложки iTunes для треков (id, artist, title): ({id: url или None}, [id, не найденные за дедлайн]).
+    Одинаковые исполнитель/название ищутся один раз.
+    """
+    keys = {track["id"]: artwork_key(track["artist"], track["title"]) for track in tracks}
+    resolved = await parser.resolve_covers(tracks)
+
+    covers = {}
+    pending = []
+    for track_id, key in keys.items():
+        if key in resolved:
+            covers[track_id] = resolved[key]
+        else:
+            pending.append(track_id)
+    return covers, pending
+
+
+
+# --- Cache Warm-up ---
+
+# Прогрев кэша после рестарта: перезапрашиваем top-N страниц жанров и поисковых запросов из снапшота
+CACHE_WARMUP_ENABLED = os.getenv("CACHE_WARMUP_ENABLED", "false").lower() in ("1", "true", "yes")
+CACHE_WARMUP_TOP_N = int(os.getenv("CACHE_WARMUP_TOP_N", "50"))
+CACHE_WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", "2"))
+
+
+def _cache_loader_for_key(cache_key: str):
+    """Возвращает функцию загрузки для ключа кэша (по namespace и параметрам) или None"""
+    path, params = parse_cache_key(cache_key)
+    try:
+        if path == "search":
+            return lambda: _load_search_results(
+                cache_key,
+                params["q"],
+                int(params["limit"]),
+                int(params["page"]),
+                params["by_artist"] == "True",
+                params["by_track"] == "True",
+                None,
+                params.get("defer_covers") == "True"
+            )
+        if path == "genre":
+            return lambda: _load_genre_tracks(
+                cache_key,
+                int(params["genre_id"]),
+                int(params["limit"]),
+                int(params["page"]),
+                None,
+                params.get("defer_covers") == "True"
+            )
+    except (KeyError, ValueError):
+        return None
+    return None
+
+
+async def warm_up_cache(keys: List[str]):
+    """
+    Фоновый прогрев кэша: перезапрашивает самые популярные ключи search/genre,
+    которых нет в кэше или которые устарели. Параллельность ограничена.
+    """
+    targets = [
+        key for key in keys
+        if not has_fresh_entry(key) and _cache_loader_for_key(key) is not None
+    ][:CACHE_WARMUP_TOP_N]
+    if not targets:
+        return
+
+    print(f"🔥 Cache warm-up started: {len(targets)} keys")
+    semaphore = asyncio.Semaphore(CACHE_WARMUP_CONCURRENCY)
+
+    async def warm(key: str) -> bool:
+        async with semaphore:
+            try:
+                # coalesce: если пользователь уже запросил этот ключ, не делаем второй запрос
+                await coalesce(key, _cache_loader_for_key(key))
+                return True
+            except Exception as e:
+                print(f"❌ Warm-up failed for '{key}': {e}")
+                return False
+
+    results = await asyncio.gather(*(warm(key) for key in targets))
+    print(f"🔥 Cache warm-up finished: {sum(results)}/{len(targets)} keys refreshed")
+
+
 
 from fastapi.responses import StreamingResponse
 import httpx
+import time
 
 from fastapi import Request
 from starlette.background import BackgroundTask
 
+async def _close_after(chunks, response: httpx.Response):
+    """Отдает чанки и закрывает ответ апстрима даже при ошибке посреди потока (тогда background не запускается)"""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await response.aclose()
+
 @app.get("/api/stream")
 async def stream_audio(request: Request, url: str = Query(..., description="URL аудио файла")):
     """
@@ -1179,22 +1623,6 @@ async def stream_audio(request: Request, url: str = Query(..., description="URL
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
     
-    # Load proxies
-    import os
-    import random
-    proxy_list_str = os.getenv("PROXY_LIST", "")
-    proxy_list = [p.strip() for p in proxy_list_str.split(",") if p.strip()]
-    
-    proxies = None
-    if proxy_list:
-        proxy = random.choice(proxy_list)
-        proxies = {"http://": proxy, "https://": proxy}
-        print(f"Using proxy for stream: {proxy}")
-    
-    # Timeout configuration
-    timeout = httpx.Timeout(15.0, read=None)
-    client = httpx.AsyncClient(follow_redirects=True, timeout=timeout, proxies=proxies)
-    
     # Forward User-Agent from request or use default
     user_agent = request.headers.get('user-agent')
     if not user_agent:
@@ -1211,46 +1639,111 @@ async def stream_audio(request: Request, url: str = Query(..., description="URL
         headers['Origin'] = 'https://rus.hitmotop.com'
     
     range_header = request.headers.get("range")
-    if range_header:
-        headers['Range'] = range_header
-        
-    async def close_client():
-        await client.aclose()
+    
+    async def open_upstream(request_range: Optional[str]) -> httpx.Response:
+        # Прокси из общего пула (выбор по здоровью, см. proxy_pool); файлы с диска прокси не требуют
+        proxy = proxy_pool.choose()
+        if proxy:
+            print(f"Using proxy for stream: {proxy}")
+        # Общий клиент на прокси: Range-запросы при перемотке переиспользуют keep-alive соединения
+        client = get_stream_client(proxy)
+        
+        request_headers = {**headers, 'Range': request_range} if request_range else headers
+        req = client.build_request("GET", url, headers=request_headers, extensions={"trace": make_trace()})
+        started = time.perf_counter()
+        try:
+            r = await client.send(req, stream=True)
+        except httpx.TransportError:
+            proxy_pool.record_error(proxy)
+            raise
+        # 403 от CDN обычно значит истекшую подписанную ссылку, а не бан прокси - не считаем его блокировкой
+        proxy_pool.record_result(proxy, r.status_code, time.perf_counter() - started, blocked_statuses=(429,))
+        return r
         
     try:
-        req = client.build_request("GET", url, headers=headers)
-        r = await client.send(req, stream=True)
-        
-        if r.status_code >= 400:
-            print(f"Stream error status: {r.status_code} for {url}")
-            await client.aclose()
-            # If 403/429, it might be blocking.
-            if r.status_code in [403, 429]:
-                 raise HTTPException(status_code=503, detail="Source blocked request")
-            raise HTTPException(status_code=r.status_code, detail="Upstream error")
-
-        response_headers = {
-            "Accept-Ranges": "bytes",
-        }
+        entry = audio_cache.lookup(url)
+        if entry is not None and entry.complete:
+            # Файл целиком на диске: отдаем без Python-итератора (zerocopysend/mmap), с ETag и условными запросами
+            cached_response = audio_cache.file_response(entry, request.headers)
+            if cached_response is not None:
+                return cached_response
+            entry = None
+        
+        # Дисковый кэш: имеющиеся куски файла отдаем с диска, пропуски докачиваем из апстрима
+        byte_range = resolve_range(range_header, entry.size) if entry else None
+        if byte_range is not None:
+            start, end = byte_range
+            response_headers = {
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(end - start),
+            }
+            if range_header:
+                response_headers["Content-Range"] = f"bytes {start}-{end - 1}/{entry.size}"
+            if entry.content_type:
+                response_headers["Content-Type"] = entry.content_type
+            
+            async def fetch_range(gap_start: int, gap_end: int) -> httpx.Response:
+                return await open_upstream(f"bytes={gap_start}-{gap_end - 1}")
+            
+            return StreamingResponse(
+                audio_cache.serve(entry, start, end, fetch_range),
+                status_code=206 if range_header else 200,
+                headers=response_headers,
+                media_type=entry.content_type
+            )
         
-        if "content-length" in r.headers:
-            response_headers["Content-Length"] = r.headers["content-length"]
-        if "content-range" in r.headers:
-            response_headers["Content-Range"] = r.headers["content-range"]
-        if "content-type" in r.headers:
-            response_headers["Content-Type"] = r.headers["content-type"]
+        r = await open_upstream(range_header)
+        try:
+            if r.status_code >= 400:
+                print(f"Stream error status: {r.status_code} for {url}")
+                # If 403/429, it might be blocking.
+                if r.status_code in [403, 429]:
+                     raise HTTPException(status_code=503, detail="Source blocked request")
+                raise HTTPException(status_code=r.status_code, detail="Upstream error")
+
+            response_headers = {
+                "Accept-Ranges": "bytes",
+            }
+            
+            if "content-length" in r.headers:
+                response_headers["Content-Length"] = r.headers["content-length"]
+            if "content-range" in r.headers:
+                response_headers["Content-Range"] = r.headers["content-range"]
+            if "content-type" in r.headers:
+                response_headers["Content-Type"] = r.headers["content-type"]
+            
+            # Пишем ответ на диск по мере отдачи (если известен полный размер файла);
+            # ошибка кэша не мешает отдать поток без него
+            body = _close_after(r.aiter_bytes(), r)
+            try:
+                target = audio_cache.entry_for_response(url, r)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Audio cache skipped for {url}: {e}")
+                target = None
+            if target is not None:
+                body = audio_cache.write_through(target[0], target[1], body)
+        except BaseException:
+            # Ответ апстрима уже открыт: без aclose соединение не вернется в пул
+            await r.aclose()
+            raise
             
         return StreamingResponse(
-            r.aiter_bytes(),
+            body,
             status_code=r.status_code,
             headers=response_headers,
             media_type=r.headers.get("content-type"),
-            background=BackgroundTask(close_client)
+            # Закрываем только ответ, соединение возвращается в пул клиента
+            background=BackgroundTask(r.aclose)
         )
     except HTTPException:
         raise
+    except NoHealthyProxyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Source temporarily unavailable",
+            headers={"Retry-After": str(int(e.retry_after + 0.999))}
+        )
     except Exception as e:
-        await client.aclose()
         print(f"Error streaming audio: {type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"Stream error: {str(e)}")
 
@@ -1854,7 +2347,13 @@ async def complete_payment(
 @app.on_event("shutdown")
 async def shutdown_event():
     """Закрытие ресурсов при остановке приложения"""
-    parser.close()
+    try:
+        saved = save_snapshot()
+        print(f"💾 Cache snapshot saved: {saved} entries")
+    except Exception as e:
+        print(f"❌ Failed to save cache snapshot: {e}")
+    await parser.close()
+    await close_stream_clients()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+"""
+Database Migration Script for generated track ids
+Rewrites `gen_<hash()>` track ids in the lyrics table to the stable
+`gen_<blake2b>` ids (see track_extractor.make_track_id).
+
+Old ids came from Python's hash(), which is randomized per process, so they can't
+be reproduced; the new id is computed from the artist/title stored in the row.
+If a row with the new id already exists, the old duplicate is removed.
+
+downloaded_messages rows are left as they are: they don't store artist/title,
+and their track_id is only informational (messages are deleted by message_id).
+
+Usage: python migrate_track_ids.py [--dry-run]
+"""
+
+import sqlite3
+import os
+import sys
+
+try:
+    from backend.track_extractor import make_track_id
+except ImportError:
+    from track_extractor import make_track_id
+
+DB_PATH = "./users.db"
+
+def migrate(dry_run: bool = False):
+    if not os.path.exists(DB_PATH):
+        print("Database doesn't exist yet. No migration needed.")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='lyrics'")
+    if not cursor.fetchone():
+        print("Table 'lyrics' doesn't exist. No migration needed.")
+        conn.close()
+        return
+
+    try:
+        cursor.execute("SELECT id, track_id, artist, title FROM lyrics WHERE track_id LIKE 'gen\\_%' ESCAPE '\\'")
+        rows = cursor.fetchall()
+
+        updated = 0
+        removed = 0
+        skipped = 0
+        for row_id, old_id, artist, title in rows:
+            if not artist and not title:
+                # Nothing to compute the new id from, the row is left as is
+                skipped += 1
+                continue
+            new_id = make_track_id(artist or "", title or "")
+            if new_id == old_id:
+                continue
+
+            cursor.execute("SELECT id FROM lyrics WHERE track_id = ?", (new_id,))
+            if cursor.fetchone():
+                # Lyrics for this song are already stored under the new id
+                print(f"  - {old_id}: duplicate of {new_id}, removing")
+                cursor.execute("DELETE FROM lyrics WHERE id = ?", (row_id,))
+                removed += 1
+            else:
+                print(f"  - {old_id} -> {new_id} ({artist} - {title})")
+                cursor.execute("UPDATE lyrics SET track_id = ? WHERE id = ?", (new_id, row_id))
+                updated += 1
+
+        if dry_run:
+            conn.rollback()
+            print(f"🔍 Dry run: {updated} rows would be updated, {removed} duplicates removed, {skipped} skipped")
+        else:
+            conn.commit()
+            print(f"✅ Migrated generated track ids: {updated} rows updated, {removed} duplicates removed, {skipped} skipped")
+    except Exception as e:
+        print(f"❌ Error during migration: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate(dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,25 @@
+"""
+Text normalization for search queries.
+The same normalized form is used for cache keys and for upstream requests,
+so "Скриптонит", "скриптонит " and "СКРИПТОНИТ" share one cache entry.
+"""
+
+import re
+import unicodedata
+
+# Apostrophes are dropped (don't -> dont), any other punctuation becomes a space (AC/DC -> ac dc)
+_APOSTROPHES_RE = re.compile(r"['’‘`´]")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]|_")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """
+    Case-folds, folds ё -> е, strips punctuation and collapses whitespace.
+    Returns an empty string if nothing meaningful is left.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = text.replace("ё", "е")
+    text = _APOSTROPHES_RE.sub("", text)
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
@@ -0,0 +1,127 @@
+"""
+Process-wide HTTP clients for /api/stream, one per proxy (None = direct).
+
+A player scrubbing through a track sends many Range requests; with a shared
+client they reuse keep-alive connections to the CDN instead of doing a new
+TCP/TLS handshake each time. Connection reuse is measured per upstream host
+(redirect hops included) with the httpcore "trace" extension: a request that
+didn't open a connection went over a reused one.
+"""
+
+import os
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+MAX_CONNECTIONS = int(os.getenv("STREAM_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("STREAM_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("STREAM_KEEPALIVE_EXPIRY", "60"))  # seconds
+CONNECT_TIMEOUT = float(os.getenv("STREAM_CONNECT_TIMEOUT", "15"))
+
+# Per-host metrics are kept for this many hosts (radio streams can point anywhere)
+MAX_TRACKED_HOSTS = 200
+
+_clients: Dict[Optional[str], httpx.AsyncClient] = {}
+_host_stats: Dict[str, Dict[str, int]] = {}
+
+
+def get_stream_client(proxy: Optional[str]) -> httpx.AsyncClient:
+    """Returns the shared streaming client for a proxy (created on first use)"""
+    client = _clients.get(proxy)
+    if client is None:
+        client = httpx.AsyncClient(
+            follow_redirects=True,
+            # No read timeout: audio is streamed to the listener as fast as they consume it
+            timeout=httpx.Timeout(CONNECT_TIMEOUT, read=None),
+            proxy=proxy,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            )
+        )
+        _clients[proxy] = client
+    return client
+
+
+def _host_counters(host: str) -> Optional[Dict[str, int]]:
+    counters = _host_stats.get(host)
+    if counters is None:
+        if len(_host_stats) >= MAX_TRACKED_HOSTS:
+            return None
+        counters = _host_stats[host] = {
+            "requests": 0, "new_connections": 0, "proxied_connections": 0, "tls_handshakes": 0
+        }
+    return counters
+
+
+def _request_host(request) -> str:
+    """
+    Upstream host of an httpcore request. Taken from the Host header: a request
+    forwarded through an HTTP proxy has the proxy in its URL.
+    """
+    for name, value in request.headers:
+        if name.lower() == b"host":
+            return urlsplit("//" + value.decode("ascii", "replace")).hostname or "unknown"
+    return request.url.host.decode("ascii", "replace")
+
+
+def make_trace():
+    """
+    Trace callback for request extensions={"trace": ...}: counts requests,
+    newly opened connections and TLS handshakes per upstream host.
+
+    httpx copies the extensions onto redirect requests, so one callback sees every
+    hop. The host is read from each hop's request; the connections opened before it
+    are charged to that host. Through a proxy the TCP connection goes to the proxy,
+    not to the host: such connections are also counted as proxied_connections.
+    """
+    dialed: List[str] = []  # hosts of the TCP connections opened for the next request
+    handshakes = 0
+
+    async def trace(event_name: str, info: dict):
+        nonlocal handshakes
+        if not event_name.endswith(".started"):
+            return
+        if event_name == "connection.connect_tcp.started":
+            dialed.append(info.get("host", ""))
+        elif event_name == "connection.start_tls.started":
+            handshakes += 1
+        elif event_name.endswith("send_request_headers.started"):
+            request = info["request"]
+            # CONNECT sets up a proxy tunnel, the request itself follows it
+            if request.method == b"CONNECT":
+                return
+            host = _request_host(request)
+            counters = _host_counters(host)
+            if counters is not None:
+                counters["requests"] += 1
+                counters["new_connections"] += len(dialed)
+                counters["proxied_connections"] += sum(1 for dialed_host in dialed if dialed_host != host)
+                counters["tls_handshakes"] += handshakes
+            dialed.clear()
+            handshakes = 0
+
+    return trace
+
+
+def get_stream_stats() -> Dict:
+    hosts = {}
+    for host, counters in _host_stats.items():
+        requests = counters["requests"]
+        reused = max(0, requests - counters["new_connections"])
+        hosts[host] = {
+            **counters,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / requests, 3) if requests else 0.0
+        }
+    return {"clients": len(_clients), "hosts": hosts}
+
+
+async def close_stream_clients():
+    """Closes all shared streaming clients (on shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,151 @@
+"""
+Tests for audio_cache: Range parsing, segment bookkeeping and LRU eviction.
+
+Run: python test_audio_cache.py  (or pytest test_audio_cache.py)
+"""
+
+import asyncio
+import os
+import tempfile
+
+try:
+    from backend.audio_cache import AudioCache, AudioEntry, is_unsatisfiable, parse_content_range, resolve_range
+except ImportError:
+    from audio_cache import AudioCache, AudioEntry, is_unsatisfiable, parse_content_range, resolve_range
+
+
+async def _chunks(data: bytes, size: int = 300):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def _drain(iterator) -> bytes:
+    return b"".join([chunk async for chunk in iterator])
+
+
+def test_resolve_range():
+    assert resolve_range(None, 1000) == (0, 1000)
+    assert resolve_range("bytes=0-99", 1000) == (0, 100)
+    assert resolve_range("bytes=900-", 1000) == (900, 1000)
+    assert resolve_range("bytes=900-5000", 1000) == (900, 1000)
+    assert resolve_range("bytes=-100", 1000) == (900, 1000)
+    assert resolve_range("bytes=-5000", 1000) == (0, 1000)
+    # Not served from the cache: unsatisfiable, malformed, multiple ranges
+    assert resolve_range("bytes=1000-", 1000) is None
+    assert resolve_range("bytes=200-100", 1000) is None
+    assert resolve_range("bytes=-0", 1000) is None
+    assert resolve_range("bytes=-", 1000) is None
+    assert resolve_range("bytes=0-1,5-6", 1000) is None
+    assert resolve_range("items=0-1", 1000) is None
+    # Only ranges past the end of the file are answered with 416, malformed ones are ignored
+    assert is_unsatisfiable("bytes=1000-", 1000)
+    assert is_unsatisfiable("bytes=-0", 1000)
+    assert not is_unsatisfiable("bytes=200-100", 1000)
+    assert not is_unsatisfiable("bytes=0-1,5-6", 1000)
+
+
+def test_parse_content_range():
+    assert parse_content_range("bytes 100-199/1000") == (100, 200, 1000)
+    assert parse_content_range("bytes 0-0/*") == (0, 1, None)
+    assert parse_content_range(None) is None
+
+
+def test_segments_and_plan():
+    entry = AudioEntry("k", "http://x/a.mp3", 1000)
+    assert entry.add_segment(0, 100) == 100
+    assert entry.add_segment(300, 400) == 100
+    assert entry.add_segment(50, 150) == 50
+    assert entry.segments == [[0, 150], [300, 400]]
+    assert entry.plan(100, 500) == [(True, 100, 150), (False, 150, 300), (True, 300, 400), (False, 400, 500)]
+    assert entry.plan(500, 600) == [(False, 500, 600)]
+    assert entry.add_segment(150, 300) == 150
+    assert entry.segments == [[0, 400]]
+    assert not entry.complete
+    entry.add_segment(400, 1000)
+    assert entry.complete
+
+
+def test_write_through_and_eviction():
+    data = bytes(range(256)) * 4
+
+    async def run(directory):
+        cache = AudioCache(directory, max_bytes=1500)
+        first = AudioEntry(cache.make_key("a"), "a", len(data))
+        second = AudioEntry(cache.make_key("b"), "b", len(data))
+        for entry in (first, second):
+            cache._entries[entry.key] = entry
+            open(cache._data_path(entry.key), "wb").close()
+
+        assert await _drain(cache.write_through(first, 100, _chunks(data[100:]), limit=400)) == data[100:500]
+        assert first.segments == [[100, 500]]
+        assert await _drain(cache.read(first, 200, 300)) == data[200:300]
+
+        # Looking up "a" makes it the most recently used one, so "b" is evicted when the budget is exceeded
+        await _drain(cache.write_through(second, 0, _chunks(data)))
+        assert cache.lookup("a") is first
+        await _drain(cache.write_through(first, 0, _chunks(data)))
+        assert cache.lookup("b") is None
+        assert cache.get_stats()["evictions"] == 1
+        assert cache.get_stats()["cached_bytes"] == len(data)
+        assert sorted(os.listdir(directory)) == [f"{first.key}.data", f"{first.key}.json"]
+
+        reloaded = AudioCache(directory, max_bytes=1500)
+        assert reloaded.load_index() == 1
+        assert reloaded.lookup("a").complete
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+def test_file_response():
+    data = bytes(range(256)) * 4
+
+    async def send_all(response, scope_extensions):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await response({"type": "http", "extensions": scope_extensions}, None, send)
+        return messages
+
+    async def run(directory):
+        cache = AudioCache(directory, max_bytes=10000)
+        entry = AudioEntry(cache.make_key("a"), "a", len(data), "audio/mpeg")
+        cache._entries[entry.key] = entry
+        open(cache._data_path(entry.key), "wb").close()
+        await _drain(cache.write_through(entry, 0, _chunks(data)))
+        assert entry.complete
+
+        response = cache.file_response(entry, {"range": "bytes=100-"})
+        assert response.status_code == 206
+        assert response.headers["content-range"] == f"bytes 100-{len(data) - 1}/{len(data)}"
+        messages = await send_all(response, {})
+        assert b"".join(message.get("body", b"") for message in messages) == data[100:]
+        assert entry.active == 0
+
+        # zerocopysend: the file is handed to the server instead of being read
+        messages = await send_all(cache.file_response(entry, {"range": "bytes=10-19"}), {"http.response.zerocopysend": {}})
+        assert (messages[1]["offset"], messages[1]["count"]) == (10, 10)
+
+        etag = response.headers["etag"]
+        assert cache.file_response(entry, {"if-none-match": f"W/{etag}"}).status_code == 304
+        # If-Modified-Since: 304 from Last-Modified on, ignored when If-None-Match is present or the date is bad
+        last_modified = response.headers["last-modified"]
+        assert cache.file_response(entry, {"if-modified-since": last_modified}).status_code == 304
+        assert cache.file_response(entry, {"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+        assert cache.file_response(entry, {"if-modified-since": "yesterday"}).status_code == 200
+        assert cache.file_response(entry, {"if-none-match": '"stale"', "if-modified-since": last_modified}).status_code == 200
+        assert cache.file_response(entry, {"range": "bytes=5000-"}).status_code == 416
+        assert cache.file_response(entry, {"range": "bytes=0-9", "if-range": etag}).status_code == 206
+        assert cache.file_response(entry, {"range": "bytes=0-9", "if-range": '"stale"'}).status_code == 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(directory))
+
+
+if __name__ == "__main__":
+    for test in (test_resolve_range, test_parse_content_range, test_segments_and_plan,
+                 test_write_through_and_eviction, test_file_response):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,57 @@
+"""
+Round-trip test for the cache snapshot: entries saved on shutdown must be served
+the same way after they are loaded by the next process.
+
+Run: python test_cache_snapshot.py  (or pytest test_cache_snapshot.py)
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+try:
+    from backend import cache, main
+    from backend.hitmo_parser_light import TrackList
+except ImportError:
+    import cache
+    import main
+    from hitmo_parser_light import TrackList
+
+
+def test_deep_search_round_trip():
+    tracks = [
+        {"id": "1", "artist": "Скриптонит", "title": "Притон", "duration": 180,
+         "url": "https://example.com/1.mp3", "image": "https://example.com/1.jpg"},
+        {"id": "2", "artist": "Баста", "title": "Сансара", "duration": 240,
+         "url": "https://example.com/2.mp3", "image": "https://example.com/2.jpg"},
+    ]
+    deep_key = cache.make_cache_key("search_deep", {"q": "скриптонит", "defer_covers": False})
+    cache.reset_cache()
+    cache.set_to_cache(deep_key, TrackList(tracks, covers_pending=True))
+    cache.set_to_cache("search_deep|q=failed", TrackList(error="Upstream error"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache_snapshot.json")
+        assert cache.save_snapshot(path) == 1
+        cache.reset_cache()
+        assert cache.load_snapshot(path, make_tracks=main._snapshot_tracks) == [deep_key]
+
+    restored = cache.peek_cache(deep_key)
+    assert isinstance(restored, TrackList)
+    assert restored == tracks and restored.covers_pending and not restored.failed
+
+    # A filtered search is built from the restored set without going upstream
+    page_key = cache.make_cache_key("search", {"q": "скриптонит", "by_artist": True})
+    payload = asyncio.run(main._load_search_results(
+        page_key, "скриптонит", limit=20, page=1, by_artist=True, by_track=False, user_agent=None
+    ))
+    assert payload.get("status_code", 200) == 200
+    assert [track["id"] for track in json.loads(payload["body"])["results"]] == ["1"]
+    assert cache.peek_cache(page_key) is payload
+    cache.reset_cache()
+
+
+if __name__ == "__main__":
+    test_deep_search_round_trip()
+    print("✅ test_deep_search_round_trip")
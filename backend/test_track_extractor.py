@@ -0,0 +1,160 @@
+"""
+Conformance test for track_extractor: every available backend must return
+exactly the same tracks as the reference bs4 backend.
+
+Run: python test_track_extractor.py  (or pytest test_track_extractor.py)
+"""
+
+import os
+
+try:
+    from backend.track_extractor import BACKENDS, ItemSplitter, extract_tracks, make_track_id, truncate_html
+except ImportError:
+    from track_extractor import BACKENDS, ItemSplitter, extract_tracks, make_track_id, truncate_html
+
+DEBUG_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_hitmo.html")
+
+# Markup of .tracks__item as served by Hitmo, plus the edge cases the parser has to survive
+TRACKS_PAGE = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>Результаты поиска</title></head>
+<body>
+<ul class="tracks__list">
+  <li class="tracks__item track mustoggler" data-track-id="123456" data-musmeta='{"artist":"Скриптонит"}'>
+    <div class="track__img" style="background-image: url('https://rus.hitmotop.com/images/cover/123456.jpg');"></div>
+    <div class="track__info">
+      <a class="track__info-l" href="/song/123456">
+        <div class="track__title">
+          Положение
+        </div>
+        <div class="track__desc">Скриптонит</div>
+      </a>
+      <div class="track__info-r">
+        <div class="track__time"><div class="track__fulltime">04:19</div></div>
+        <a class="track__download-btn" href="https://rus.hitmotop.com/get/music/20171202/Skriptonit_-_Polozhenie.mp3" download></a>
+      </div>
+    </div>
+  </li>
+  <li class="tracks__item track" data-track-id="">
+    <div class="track__img" style="background-image: url(https://rus.hitmotop.com/images/cover/no-quotes.jpg)"></div>
+    <div class="track__title">AC/DC &amp; <b>Friends</b></div>
+    <div class="track__desc">Rock &#39;n&#39; Roll</div>
+    <div class="track__fulltime">1:02:03</div>
+    <a class="track__download-btn" href="/get/music/acdc.mp3"></a>
+  </li>
+  <li class="tracks__item track" data-track-id="777">
+    <div class="track__title">Без артиста и обложки</div>
+    <a class="track__download-btn" href="/get/music/no_artist.mp3"></a>
+  </li>
+  <li class="tracks__item track" data-track-id="888">
+    <div class="track__title">Нет ссылки</div>
+    <div class="track__desc">Пропускается</div>
+  </li>
+  <li class="tracks__item track" data-track-id="999">
+    <div class="track__title">Пустая ссылка</div>
+    <a class="track__download-btn" href=""></a>
+  </li>
+  <li class="tracks__item track" data-track-id="1000">
+    <div class="track__img" style="background-color: #000"></div>
+    <div class="track__title">Ёлка</div>
+    <div class="track__desc">Ёлка</div>
+    <div class="track__fulltime">--:--</div>
+    <a class="track__download-btn" href="/get/music/elka.mp3"></a>
+  </li>
+</ul>
+</body></html>
+"""
+
+
+def assert_backends_agree(html: str, limit=None) -> list:
+    expected = extract_tracks(html, limit, backend="bs4")
+    for name in BACKENDS:
+        got = extract_tracks(html, limit, backend=name)
+        assert got == expected, f"{name} differs from bs4:\n{got}\n!=\n{expected}"
+    return expected
+
+
+def test_debug_page():
+    with open(DEBUG_PAGE, encoding="utf-8") as f:
+        html = f.read()
+    # The checked-in page is a truncated "no results" dump: nothing to extract, nothing to crash on
+    assert assert_backends_agree(html) == []
+
+
+def test_tracks_page():
+    tracks = assert_backends_agree(TRACKS_PAGE)
+    assert [t['title'] for t in tracks] == ["Положение", "AC/DC & Friends", "Без артиста и обложки", "Ёлка"]
+
+    first = tracks[0]
+    assert first['id'] == "123456"
+    assert first['artist'] == "Скриптонит"
+    assert first['duration'] == 259
+    assert first['fallback_image'] == "https://rus.hitmotop.com/images/cover/123456.jpg"
+
+    assert tracks[1]['id'] == make_track_id("Rock 'n' Roll", "AC/DC & Friends")
+    assert tracks[1]['artist'] == "Rock 'n' Roll"
+    assert tracks[1]['duration'] == 0
+    assert tracks[1]['fallback_image'] == "https://rus.hitmotop.com/images/cover/no-quotes.jpg"
+
+    assert tracks[2]['artist'] == "Unknown"
+    assert tracks[2]['fallback_image'] is None
+    assert tracks[3]['fallback_image'] is None
+
+
+def test_limit():
+    assert [t['id'] for t in assert_backends_agree(TRACKS_PAGE, limit=1)] == ["123456"]
+    assert len(assert_backends_agree(TRACKS_PAGE, limit=3)) == 3
+
+
+def test_truncated_parse_matches_full_parse():
+    full = assert_backends_agree(TRACKS_PAGE)
+    for limit in range(len(full) + 2):
+        # Items 4 and 5 have no usable link, so limits past 3 must fall back to the full page
+        assert assert_backends_agree(TRACKS_PAGE, limit=limit) == full[:limit]
+
+
+def test_truncate_html():
+    assert truncate_html(TRACKS_PAGE, 100) is TRACKS_PAGE
+    head = truncate_html(TRACKS_PAGE, 2)
+    assert head.count('class="tracks__item') == 2
+    assert TRACKS_PAGE.startswith(head)
+    # Similar class names are not item boundaries
+    assert truncate_html('<li class="tracks__item-x"></li><li class="a tracks__item"></li>', 0).startswith('<li class="tracks__item-x">')
+
+
+def test_item_splitter():
+    expected = extract_tracks(TRACKS_PAGE)
+    for chunk_size in (1, 7, 64, 500, len(TRACKS_PAGE)):
+        splitter = ItemSplitter()
+        tracks = []
+        for start in range(0, len(TRACKS_PAGE), chunk_size):
+            tracks += extract_tracks(splitter.feed(TRACKS_PAGE[start:start + chunk_size]))
+        tracks += extract_tracks(splitter.close())
+        assert tracks == expected, f"chunk size {chunk_size}"
+
+
+def test_item_splitter_no_items():
+    splitter = ItemSplitter()
+    assert splitter.feed('<html><body class="tracks__item') == ""
+    assert splitter.feed('-empty">nothing here</body></html>') == ""
+    assert splitter.close() == ""
+
+
+def test_generated_ids_are_stable():
+    # Pinned value: stored ids (lyrics cache) depend on it, a new scheme needs a migration
+    assert make_track_id("Rock 'n' Roll", "AC/DC & Friends") == "gen_d8bdef8e555a7dd3"
+    # Same normalized artist/title -> same id
+    assert make_track_id("ROCK N ROLL", " ac dc  friends ") == "gen_d8bdef8e555a7dd3"
+    assert make_track_id("Скриптонит", "Положение") != make_track_id("Скриптонит", "Вечеринка")
+
+
+def test_empty_input():
+    assert assert_backends_agree("") == []
+
+
+if __name__ == "__main__":
+    print(f"Backends: {', '.join(BACKENDS)}")
+    for test in (test_debug_page, test_tracks_page, test_limit, test_truncated_parse_matches_full_parse,
+                 test_truncate_html, test_item_splitter, test_item_splitter_no_items,
+                 test_generated_ids_are_stable, test_empty_input):
+        test()
+        print(f"✅ {test.__name__}")
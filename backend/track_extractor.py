@@ -0,0 +1,296 @@
+"""
+Track extraction from Hitmo search/genre pages.
+
+Pluggable backends, all producing identical track dicts:
+  - selectolax (Lexbor): fastest, used by default when installed
+  - lxml: XPath over libxml2
+  - bs4: the original BeautifulSoup + html.parser implementation, always available
+
+Backend is chosen with HITMO_PARSER_BACKEND (auto | selectolax | lxml | bs4).
+With a limit, the page is cut after the items that are needed before it is parsed,
+so a 20-track request on a 48-track page parses roughly 20/48 of it.
+"""
+
+import hashlib
+import os
+import re
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    from backend.normalize import normalize_query
+except ImportError:
+    from normalize import normalize_query
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+PARSER_BACKEND = os.getenv("HITMO_PARSER_BACKEND", "auto").lower()
+
+_COVER_URL_RE = re.compile(r"url\(['\"]?(.*?)['\"]?\)")
+# Opening tag of a track item: <li class="tracks__item track ..."
+# (the whole class value has to be there, so a chunk ending in "tracks__item" is not a match yet)
+_ITEM_START_RE = re.compile(r"<[a-zA-Z][^>]*?\bclass\s*=\s*[\"'][^\"']*?(?<![\w-])tracks__item(?![\w-])[^\"']*[\"']")
+
+
+def make_track_id(artist: str, title: str) -> str:
+    """
+    Id for items without data-track-id: a digest of the normalized artist/title,
+    so it is the same in every worker and after restarts (unlike hash()).
+    Changing the scheme invalidates stored ids, see migrate_track_ids.py.
+    """
+    content = f"{normalize_query(artist)}\x1f{normalize_query(title)}"
+    return "gen_" + hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _build_track(track_id: Optional[str], title: str, artist: Optional[str],
+                 duration_str: Optional[str], url: Optional[str],
+                 style: Optional[str]) -> Optional[Dict]:
+    """
+    Turns raw field values of one `.tracks__item` into a track dict.
+    Shared by all backends, so they only differ in how the values are found.
+    """
+    if not url:
+        return None
+
+    title = title.strip()
+    artist = artist.strip() if artist is not None else "Unknown"
+    duration_str = duration_str.strip() if duration_str is not None else "00:00"
+
+    try:
+        mins, secs = map(int, duration_str.split(':'))
+        duration = mins * 60 + secs
+    except ValueError:
+        duration = 0
+
+    if not track_id:
+        track_id = make_track_id(artist, title)
+
+    # Fallback cover from the inline style
+    fallback_image = None
+    if style:
+        match = _COVER_URL_RE.search(style)
+        if match:
+            fallback_image = match.group(1)
+
+    return {
+        'id': track_id,
+        'title': title,
+        'artist': artist,
+        'duration': duration,
+        'url': url,
+        'fallback_image': fallback_image
+    }
+
+
+def _iter_bs4(html: str) -> Iterator[Dict]:
+    soup = BeautifulSoup(html, 'html.parser')
+    for el in soup.select('.tracks__item'):
+        try:
+            title_el = el.select_one('.track__title')
+            download_el = el.select_one('a.track__download-btn')
+            if not (title_el and download_el):
+                continue
+            artist_el = el.select_one('.track__desc')
+            time_el = el.select_one('.track__fulltime')
+            cover_el = el.select_one('.track__img')
+            track = _build_track(
+                el.get('data-track-id'),
+                title_el.text,
+                artist_el.text if artist_el else None,
+                time_el.text if time_el else None,
+                download_el.get('href'),
+                cover_el.get('style') if cover_el else None
+            )
+        except Exception as e:
+            print(f"Error parsing track: {e}")
+            continue
+        if track:
+            yield track
+
+
+def _iter_selectolax(html: str) -> Iterator[Dict]:
+    tree = LexborHTMLParser(html)
+    for el in tree.css('.tracks__item'):
+        try:
+            title_el = el.css_first('.track__title')
+            download_el = el.css_first('a.track__download-btn')
+            if not (title_el and download_el):
+                continue
+            artist_el = el.css_first('.track__desc')
+            time_el = el.css_first('.track__fulltime')
+            cover_el = el.css_first('.track__img')
+            track = _build_track(
+                el.attributes.get('data-track-id'),
+                title_el.text(),
+                artist_el.text() if artist_el else None,
+                time_el.text() if time_el else None,
+                download_el.attributes.get('href'),
+                cover_el.attributes.get('style') if cover_el else None
+            )
+        except Exception as e:
+            print(f"Error parsing track: {e}")
+            continue
+        if track:
+            yield track
+
+
+def _class_xpath(class_name: str, tag: str = "*") -> str:
+    return f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+
+_XPATH_ITEM = _class_xpath('tracks__item')
+_XPATH_TITLE = _class_xpath('track__title')
+_XPATH_DESC = _class_xpath('track__desc')
+_XPATH_TIME = _class_xpath('track__fulltime')
+_XPATH_DOWNLOAD = _class_xpath('track__download-btn', 'a')
+_XPATH_COVER = _class_xpath('track__img')
+
+
+def _first(el, xpath: str):
+    found = el.xpath(xpath)
+    return found[0] if found else None
+
+
+def _iter_lxml(html: str) -> Iterator[Dict]:
+    if not html.strip():
+        return
+    root = lxml.html.document_fromstring(html)
+    for el in root.xpath(_XPATH_ITEM):
+        try:
+            title_el = _first(el, _XPATH_TITLE)
+            download_el = _first(el, _XPATH_DOWNLOAD)
+            if title_el is None or download_el is None:
+                continue
+            artist_el = _first(el, _XPATH_DESC)
+            time_el = _first(el, _XPATH_TIME)
+            cover_el = _first(el, _XPATH_COVER)
+            track = _build_track(
+                el.get('data-track-id'),
+                title_el.text_content(),
+                artist_el.text_content() if artist_el is not None else None,
+                time_el.text_content() if time_el is not None else None,
+                download_el.get('href'),
+                cover_el.get('style') if cover_el is not None else None
+            )
+        except Exception as e:
+            print(f"Error parsing track: {e}")
+            continue
+        if track:
+            yield track
+
+
+BACKENDS: Dict[str, Callable[[str], Iterator[Dict]]] = {'bs4': _iter_bs4}
+if LexborHTMLParser is not None:
+    BACKENDS['selectolax'] = _iter_selectolax
+if lxml is not None:
+    BACKENDS['lxml'] = _iter_lxml
+
+
+def _resolve_backend(name: str) -> str:
+    if name == "auto":
+        for candidate in ("selectolax", "lxml", "bs4"):
+            if candidate in BACKENDS:
+                return candidate
+    if name not in BACKENDS:
+        print(f"WARNING: HITMO_PARSER_BACKEND={name} is not available, using bs4")
+        return "bs4"
+    return name
+
+
+DEFAULT_BACKEND = _resolve_backend(PARSER_BACKEND)
+
+
+def truncate_html(html: str, limit: int) -> str:
+    """
+    Cuts the page right before the (limit + 1)-th track item, so the parser never
+    builds the rest of the document. Returns `html` itself if there is nothing to cut.
+    """
+    for count, match in enumerate(_ITEM_START_RE.finditer(html)):
+        if count == limit:
+            return html[:match.start()]
+    return html
+
+
+def iter_tracks(html: str, limit: Optional[int] = None, backend: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Yields tracks from a Hitmo page, parsing only as much of it as `limit` needs.
+    Items without a title or download link are skipped; if that leaves the truncated
+    page short of `limit`, the remainder comes from the full page.
+    """
+    parse = BACKENDS[backend or DEFAULT_BACKEND]
+    if limit is None:
+        yield from parse(html)
+        return
+
+    head = truncate_html(html, limit)
+    produced = 0
+    for track in islice(parse(head), limit):
+        produced += 1
+        yield track
+
+    if produced < limit and head is not html:
+        yield from islice(parse(html), produced, limit)
+
+
+def extract_tracks(html: str, limit: Optional[int] = None, backend: Optional[str] = None) -> List[Dict]:
+    """
+    Extracts up to `limit` tracks from a Hitmo page.
+    Each track has id, title, artist, duration, url and fallback_image (cover from inline style).
+    """
+    return list(iter_tracks(html, limit, backend))
+
+
+class ItemSplitter:
+    """
+    Splits a page arriving in chunks into HTML fragments of complete track items.
+    An item is complete once the next item starts; the last one is returned by close().
+    Each fragment can be passed to extract_tracks on its own.
+    """
+
+    # How far back into already scanned text an item tag may start (tags split across chunks)
+    LOOKBACK = 4096
+
+    def __init__(self):
+        self._buffer = ""
+        self._scan_from = 0
+        self._in_item = False  # True: the buffer starts with an incomplete item
+
+    def feed(self, text: str) -> str:
+        """Adds a chunk, returns the items completed by it (empty string if none)"""
+        self._buffer += text
+        starts = [m.start() for m in _ITEM_START_RE.finditer(self._buffer, self._scan_from)]
+
+        if not self._in_item:
+            if not starts:
+                # Still in the page header: keep only the tail that may hold a split tag
+                self._buffer = self._buffer[-self.LOOKBACK:]
+                self._scan_from = 0
+                return ""
+            self._buffer = self._buffer[starts[0]:]
+            starts = [start - starts[0] for start in starts[1:]]
+            self._in_item = True
+
+        if not starts:
+            self._scan_from = max(1, len(self._buffer) - self.LOOKBACK)
+            return ""
+
+        fragment, self._buffer = self._buffer[:starts[-1]], self._buffer[starts[-1]:]
+        self._scan_from = max(1, len(self._buffer) - self.LOOKBACK)
+        return fragment
+
+    def close(self) -> str:
+        """Returns the last (unterminated) item, if any"""
+        fragment = self._buffer if self._in_item else ""
+        self._buffer = ""
+        self._in_item = False
+        return fragment